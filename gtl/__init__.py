@@ -0,0 +1,31 @@
+"""Google Takeout Location parser. See gtl.api for the library interface."""
+
+from .api import (
+    Location,
+    TimelineSegment,
+    load,
+    read,
+    records,
+    search,
+    to_store,
+    write_arrow,
+    write_csv,
+    write_excel,
+    write_kml,
+    write_parquet,
+)
+
+__all__ = [
+    "Location",
+    "TimelineSegment",
+    "load",
+    "read",
+    "records",
+    "search",
+    "to_store",
+    "write_arrow",
+    "write_csv",
+    "write_excel",
+    "write_kml",
+    "write_parquet",
+]
@@ -0,0 +1,331 @@
+"""
+Library interface to gtl.
+
+    import gtl
+
+    for location in gtl.read("Records.json", date_range="2019-01-01..2019-01-31"):
+        print(location.time("Europe/London"), location.latitude, location.longitude)
+
+read() parses an export into a column store (through the parse cache only with cache=True),
+applies the search filters to whole columns and only then yields one small immutable record per
+row, a block of rows at a time, so a caller that stops early never builds the records it did
+not ask for. Timestamps in the records are UTC epoch milliseconds and coordinates are decimal
+degrees. The write_* functions accept any iterable of records, including a filtered or edited
+read(). Errors are raised as ValueError, OSError or ImportError, never by exiting.
+"""
+
+import os
+from array import array
+from itertools import chain
+from typing import NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+from .store import (
+    E7,
+    KINDS,
+    ColumnBuilder,
+    LocationStore,
+    StringTable,
+    TimelineBuilder,
+    TimelineStore,
+)
+from .cache import CACHE_SIZE_MB
+from .filters import SearchFilter
+from .spatial import load_regions, search_regions
+from .timeutil import MISSING_TIMESTAMP, from_epoch_ms
+
+BLOCK_ROWS = 4096
+KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+
+
+class Location(NamedTuple):
+    """One raw location fix from Records.json"""
+
+    timestamp: int
+    latitude: float
+    longitude: float
+    accuracy: int
+    source: str
+    device_tag: int
+    device_designation: str
+    activity_timestamp: Optional[int]
+    motions: Tuple[str, ...]
+    region: Optional[str] = None
+
+    def time(self, tz="UTC"):
+        return from_epoch_ms(self.timestamp, ZoneInfo(str(tz)))
+
+
+class TimelineSegment(NamedTuple):
+    """One activitySegment or placeVisit from Semantic Location History. A place visit starts
+    and ends at the same coordinates."""
+
+    kind: str
+    start_timestamp: int
+    end_timestamp: int
+    start_latitude: float
+    start_longitude: float
+    end_latitude: float
+    end_longitude: float
+    waypoints: Tuple[Tuple[float, float], ...]
+    activity_type: str
+    confidence: str
+    source: str
+    detail: Tuple[str, ...]
+    region: Optional[str] = None
+
+    def start(self, tz="UTC"):
+        return from_epoch_ms(self.start_timestamp, ZoneInfo(str(tz)))
+
+    def end(self, tz="UTC"):
+        return from_epoch_ms(self.end_timestamp, ZoneInfo(str(tz)))
+
+
+def store_format(store):
+    return "timeline" if isinstance(store, TimelineStore) else "locations"
+
+
+def load(path, tz="UTC", stream=False, cache=False, jobs=1, json_backend=None):
+    """Parses a JSON export, or a directory or glob pattern of them, into an unfiltered
+    column store. With cache set it goes through the parse cache, as the command line does.
+    json_backend names a decoder from jsonbackend.BACKENDS, by default the fastest one
+    installed. Raises ValueError for files without any records or a json_backend that is
+    not installed, and OSError for files that cannot be read."""
+    from .gtl import find_inputs, load_file, load_files
+
+    cache_size = CACHE_SIZE_MB if cache else None
+    inputs = find_inputs(path)
+    if not inputs:
+        raise FileNotFoundError(f"No JSON files found at {path}")
+    if os.path.isfile(path):
+        store, _ = load_file(
+            path, str(tz), stream, cache_size, json_backend=json_backend
+        )
+    else:
+        store, _ = load_files(
+            inputs, str(tz), stream, cache_size, jobs, json_backend=json_backend
+        )
+    return store
+
+
+def search(
+    store,
+    date_range=None,
+    time_range=None,
+    top_left=None,
+    bottom_right=None,
+    regions=None,
+):
+    """Applies the same filters as the command line options of the same names. top_left and
+    bottom_right are (lat, long) pairs, and regions is a regions file or a list of
+    spatial.Region"""
+    search_grid = [top_left, bottom_right] if top_left and bottom_right else None
+    store = SearchFilter(store.tz, date_range, time_range, search_grid).apply(store)
+    if regions:
+        if isinstance(regions, str):
+            regions = load_regions(regions)
+        store = search_regions(store, regions)
+    return store
+
+
+def location_records(store, start, stop):
+    regions = store.regions(start, stop) or [None] * (stop - start)
+    activity_timestamps = [
+        None if timestamp == MISSING_TIMESTAMP else timestamp
+        for timestamp in store.activity_timestamp[start:stop].tolist()
+    ]
+    return map(
+        Location._make,
+        zip(
+            store.timestamp[start:stop].tolist(),
+            (store.latitude[start:stop] / E7).tolist(),
+            (store.longitude[start:stop] / E7).tolist(),
+            store.accuracy[start:stop].tolist(),
+            store.decode("source", start, stop),
+            store.decode("device_tag", start, stop),
+            store.decode("device_designation", start, stop),
+            activity_timestamps,
+            store.decode("motions", start, stop),
+            regions,
+        ),
+    )
+
+
+def timeline_records(store, start, stop):
+    offsets = store.waypoint_offsets[start : stop + 1]
+    first, last = int(offsets[0]), int(offsets[-1])
+    points = list(
+        zip(
+            (store.waypoint_latitude[first:last] / E7).tolist(),
+            (store.waypoint_longitude[first:last] / E7).tolist(),
+        )
+    )
+    offsets = (offsets - first).tolist()
+    waypoints = [
+        tuple(points[offsets[i] : offsets[i + 1]]) for i in range(stop - start)
+    ]
+    regions = store.regions(start, stop) or [None] * (stop - start)
+    return map(
+        TimelineSegment._make,
+        zip(
+            [KINDS[kind] for kind in store.kind[start:stop].tolist()],
+            store.start_timestamp[start:stop].tolist(),
+            store.end_timestamp[start:stop].tolist(),
+            (store.start_latitude[start:stop] / E7).tolist(),
+            (store.start_longitude[start:stop] / E7).tolist(),
+            (store.end_latitude[start:stop] / E7).tolist(),
+            (store.end_longitude[start:stop] / E7).tolist(),
+            waypoints,
+            store.decode("activity_type", start, stop),
+            store.decode("confidence", start, stop),
+            store.decode("source", start, stop),
+            store.decode("detail", start, stop),
+            regions,
+        ),
+    )
+
+
+def records(store, block_rows=BLOCK_ROWS):
+    """Yields a Location or TimelineSegment for each row of a store, building block_rows of
+    them at a time"""
+    make = timeline_records if isinstance(store, TimelineStore) else location_records
+    for start in range(0, len(store), block_rows):
+        yield from make(store, start, min(start + block_rows, len(store)))
+
+
+def read(
+    path,
+    tz="UTC",
+    date_range=None,
+    time_range=None,
+    top_left=None,
+    bottom_right=None,
+    regions=None,
+    stream=False,
+    cache=False,
+):
+    """Yields the records of an export that pass the filters, in time order. tz is the
+    timezone date_range and time_range are evaluated in."""
+    store = search(
+        load(path, tz, stream, cache),
+        date_range,
+        time_range,
+        top_left,
+        bottom_right,
+        regions,
+    )
+    yield from records(store)
+
+
+def e7(degrees):
+    return round(degrees * E7)
+
+
+def to_store(items, tz="UTC"):
+    """Collects an iterable of Location or TimelineSegment records back into a column store,
+    keeping their region labels if they have any"""
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        return LocationStore(tz=str(tz))
+    timeline = isinstance(first, TimelineSegment)
+    if timeline:
+        builder = TimelineBuilder(str(tz))
+    else:
+        builder = ColumnBuilder(LocationStore, str(tz))
+    region_table = StringTable()
+    region_codes = array("I")
+    labelled = False
+    for item in chain((first,), items):
+        if timeline:
+            builder.append(
+                KIND_CODES[item.kind],
+                item.start_timestamp,
+                item.end_timestamp,
+                e7(item.start_latitude),
+                e7(item.start_longitude),
+                e7(item.end_latitude),
+                e7(item.end_longitude),
+                [(e7(lat), e7(long)) for lat, long in item.waypoints],
+                item.activity_type,
+                item.confidence,
+                item.source,
+                tuple(item.detail),
+            )
+        else:
+            append_location(builder, item)
+        labelled = labelled or item.region is not None
+        region_codes.append(region_table.encode(item.region or ""))
+    store = builder.build()
+    if labelled:
+        store.with_regions(region_codes, region_table)
+    return store
+
+
+def append_location(builder, location):
+    columns = builder.columns
+    tables = builder.tables
+    columns["timestamp"].append(location.timestamp)
+    columns["latitude"].append(e7(location.latitude))
+    columns["longitude"].append(e7(location.longitude))
+    columns["accuracy"].append(location.accuracy)
+    columns["source"].append(tables["source"].encode(location.source))
+    columns["device_tag"].append(tables["device_tag"].encode(location.device_tag))
+    columns["device_designation"].append(
+        tables["device_designation"].encode(location.device_designation)
+    )
+    activity_timestamp = location.activity_timestamp
+    columns["activity_timestamp"].append(
+        MISSING_TIMESTAMP if activity_timestamp is None else activity_timestamp
+    )
+    columns["motions"].append(tables["motions"].encode(tuple(location.motions)))
+
+
+def write_kml(
+    filename,
+    items,
+    tz="UTC",
+    batch=2500,
+    shared_styles=False,
+    kmz_level=None,
+    waypoint_points=True,
+):
+    """Writes the records as KML (or KMZ with a kmz_level) batches of `batch` features, named
+    like the command line output. Returns the paths written."""
+    from .kml import write_kml as write_store
+
+    store = to_store(items, tz)
+    return write_store(
+        filename,
+        store,
+        store_format(store),
+        batch,
+        shared_styles,
+        kmz_level=kmz_level,
+        waypoint_points=waypoint_points,
+    )
+
+
+def write_excel(filename, items, tz="UTC"):
+    from .gtl import generate_excel
+
+    store = to_store(items, tz)
+    return generate_excel(filename, store, store_format(store))
+
+
+def write_csv(filename, items, tz="UTC"):
+    from .gtl import generate_csv
+
+    store = to_store(items, tz)
+    return generate_csv(filename, store, store_format(store))
+
+
+def write_parquet(filename, items, tz="UTC"):
+    from .columnar import write_parquet as write_store
+
+    return write_store(filename, to_store(items, tz))
+
+
+def write_arrow(filename, items, tz="UTC"):
+    from .columnar import write_arrow as write_store
+
+    return write_store(filename, to_store(items, tz))
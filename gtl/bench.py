@@ -0,0 +1,383 @@
+"""
+Benchmarks each stage of the pipeline separately and writes the results as JSON.
+
+Every stage (ingest, parse_json, the search filters and each writer) is timed on its own over
+either a given export or synthetic data from gtl.synth, and reported with its throughput and
+the process' peak resident memory afterwards. With --trace-memory each stage is run a second
+time under tracemalloc to report the peak memory allocated by that stage alone. Keeping the
+JSON output of each version makes regressions easy to spot.
+
+With --startup it instead times starting the CLI in a fresh interpreter, and fails if any of
+the output backends' dependencies (simplekml, xlsxwriter, pyarrow, multiprocessing) are
+imported before they are needed. With --json-backends it times ingest of the same inputs with
+each installed JSON backend, and fails if any of them decodes differently from the standard
+library.
+
+    python -m gtl.bench --records 1000000 --timeline 20000 -o bench.json
+    python -m gtl.bench --startup
+    python -m gtl.bench --json-backends --records 1000000
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime as dt, timezone
+import numpy as np
+from .gtl import (
+    __version__,
+    generate_csv,
+    generate_excel,
+    generate_kml,
+    ingest,
+    parse_json,
+    stream_ingest,
+)
+from .filters import SearchFilter
+from .jsonbackend import available_backends
+from .kml import write_kml
+from .stats import peak_rss
+from .store import E7, TimelineStore
+from .synth import write_records, write_timeline
+
+STAGES = (
+    "ingest",
+    "parse_json",
+    "stream_parse",
+    "filter",
+    "write_kml",
+    "generate_kml",
+    "generate_excel",
+    "generate_csv",
+)
+MB = 1 << 20
+STARTUP_RUNS = 10
+STARTUP_COMMANDS = {
+    "import": ["-c", "import gtl.gtl"],
+    "list_timezones": ["-m", "gtl.gtl", "-l"],
+    "help": ["-m", "gtl.gtl", "-h"],
+}
+LAZY_MODULES = (
+    "pandas",
+    "simplekml",
+    "xlsxwriter",
+    "pyarrow",
+    "multiprocessing",
+    "urllib.request",
+)
+
+
+def benchmark_filter(store):
+    """A search over the middle of the data: the middle third of the dates, working hours
+    and the box around the middle half of the coordinates"""
+    if isinstance(store, TimelineStore):
+        timestamps, latitude, longitude = (
+            store.start_timestamp,
+            store.start_latitude,
+            store.start_longitude,
+        )
+    else:
+        timestamps, latitude, longitude = (
+            store.timestamp,
+            store.latitude,
+            store.longitude,
+        )
+    first, last = np.percentile(timestamps, [33, 67]).astype("int64")
+    dates = np.array([first, last]).astype("datetime64[ms]").astype("datetime64[D]")
+    low_lat, high_lat = np.percentile(latitude, [25, 75]) / E7
+    low_long, high_long = np.percentile(longitude, [25, 75]) / E7
+    return SearchFilter(
+        store.tz,
+        f"{dates[0]}..{dates[1]}",
+        "08:00:00..18:00:00",
+        [(high_lat, low_long), (low_lat, high_long)],
+    )
+
+
+def run_filter(store):
+    # Drop the time index left by an earlier run so that building it is timed as well
+    store.index = None
+    return benchmark_filter(store).apply(store)
+
+
+def run_stage(name, function, records, size=None, trace=False):
+    """Times one call of function, then optionally repeats it under tracemalloc"""
+    gc.collect()
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+            peak_traced = None
+            if trace:
+                gc.collect()
+                tracemalloc.start()
+                function()
+                peak_traced = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    entry = {
+        "stage": name,
+        "seconds": round(seconds, 6),
+        "records": records,
+        "records_per_second": round(records / seconds, 1) if seconds else None,
+    }
+    if size is not None:
+        entry["bytes"] = size
+        entry["mb_per_second"] = round(size / MB / seconds, 3) if seconds else None
+    rss = peak_rss()
+    entry["peak_rss_mb"] = round(rss / MB, 1) if rss else None
+    if trace:
+        entry["peak_traced_mb"] = round(peak_traced / MB, 1)
+    print(
+        f"[-] {name:<15} {seconds:10.3f}s {entry['records_per_second'] or 0:>14,.0f} records/s",
+        file=sys.stderr,
+    )
+    return result, entry
+
+
+def benchmark(path, stages=STAGES, tz="UTC", batch=2500, trace=False, output_dir=None):
+    """Runs the selected stages over one JSON export and returns the results"""
+    size = os.path.getsize(path)
+    results = {"input": path, "bytes": size, "stages": []}
+    content = ingest(path)
+    store, fmt = parse_json(content, tz)
+    records = len(store)
+    results["format"] = fmt
+    results["records"] = records
+    output_dir = output_dir or tempfile.mkdtemp(prefix="gtl-bench-")
+    filename = os.path.join(output_dir, os.path.basename(path))
+    stage_functions = {
+        "ingest": (lambda: ingest(path), size),
+        "parse_json": (lambda: parse_json(content, tz), None),
+        "stream_parse": (lambda: parse_json(stream_ingest(path), tz), size),
+        "filter": (lambda: run_filter(store), None),
+        "write_kml": (lambda: write_kml(filename, store, fmt, batch), None),
+        "generate_kml": (lambda: generate_kml(filename, store, fmt, batch), None),
+        "generate_excel": (lambda: generate_excel(filename, store, fmt), None),
+        "generate_csv": (lambda: generate_csv(filename, store, fmt), None),
+    }
+    print(
+        f"[-] Benchmarking {path} - {records} {fmt} records, {size / MB:.1f} MB",
+        file=sys.stderr,
+    )
+    for name in stages:
+        function, stage_size = stage_functions[name]
+        _, entry = run_stage(name, function, records, stage_size, trace)
+        results["stages"].append(entry)
+    return results
+
+
+def json_backends(path, trace=False):
+    """Times ingest of one export with each installed JSON backend, and marks whether each
+    decoded it exactly as the standard library does"""
+    size = os.path.getsize(path)
+    content = ingest(path, "json")
+    records = len(next(iter(content.values()), []))
+    # repr tells 1 from 1.0 and keeps key order, unlike ==
+    reference = repr(content)
+    del content
+    results = {"input": path, "bytes": size, "records": records, "backends": []}
+    for name in available_backends():
+        content, entry = run_stage(
+            f"ingest[{name}]", lambda: ingest(path, name), records, size, trace
+        )
+        entry["backend"] = name
+        entry["identical"] = repr(content) == reference
+        results["backends"].append(entry)
+        del content
+    return results
+
+
+def run_python(args):
+    """Runs the current interpreter with gtl importable from this source tree"""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (package_root, env.get("PYTHONPATH")) if path
+    )
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def startup(runs=STARTUP_RUNS):
+    """Times each of STARTUP_COMMANDS in a fresh interpreter, against a bare interpreter,
+    and lists any of LAZY_MODULES that importing gtl.gtl loads"""
+    results = {"runs": runs, "commands": []}
+    for name, args in {"python": ["-c", "pass"], **STARTUP_COMMANDS}.items():
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run_python(args)
+            times.append(time.perf_counter() - start)
+        entry = {
+            "command": name,
+            "median_seconds": round(statistics.median(times), 4),
+            "min_seconds": round(min(times), 4),
+        }
+        results["commands"].append(entry)
+        print(
+            f"[-] {name:<15} {entry['median_seconds']:10.3f}s median of {runs}",
+            file=sys.stderr,
+        )
+    check = (
+        f"import sys, gtl.gtl; modules = {LAZY_MODULES!r}; "
+        "print(' '.join(name for name in modules if name in sys.modules))"
+    )
+    results["eager_imports"] = run_python(["-c", check]).stdout.split()
+    return results
+
+
+def environment():
+    return {
+        "gtl_version": __version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": dt.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def write_results(results, path=None):
+    report = json.dumps(results, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(report + "\n")
+        print(f"[+] Benchmark results written to {path}", file=sys.stderr)
+    else:
+        print(report)
+
+
+def main():
+    arg_parse = argparse.ArgumentParser(
+        description="Benchmark each stage of the Google Takeout Location Parser"
+    )
+    arg_parse.add_argument(
+        "-i",
+        "--input",
+        metavar="input_file",
+        action="append",
+        help="JSON file to benchmark, can be given more than once. Without it, synthetic "
+        "data is generated",
+    )
+    arg_parse.add_argument(
+        "--records",
+        help="Number of synthetic location records, default is 10000",
+        type=int,
+        default=10000,
+    )
+    arg_parse.add_argument(
+        "--timeline",
+        help="Number of synthetic timeline objects, default is 2000",
+        type=int,
+        default=2000,
+    )
+    arg_parse.add_argument(
+        "--stages",
+        help=f"Comma separated stages to run, default is all of {','.join(STAGES)}",
+        default=",".join(STAGES),
+    )
+    arg_parse.add_argument(
+        "-t", "--tz", help="Timezone used for output, default is UTC", default="UTC"
+    )
+    arg_parse.add_argument(
+        "-b",
+        "--batch",
+        help="Batch size for KML output, default is 2500",
+        type=int,
+        default=2500,
+    )
+    arg_parse.add_argument(
+        "--trace-memory",
+        help="Run each stage again under tracemalloc to report its own peak allocation",
+        action="store_true",
+    )
+    arg_parse.add_argument("--seed", help="Random seed, default is 0", type=int, default=0)
+    arg_parse.add_argument(
+        "--startup",
+        help="Benchmark CLI startup instead, and fail if an output backend is imported "
+        "before it is needed",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--json-backends",
+        help="Benchmark ingest with each installed JSON backend instead, and fail if "
+        "any of them decodes differently from the standard library",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "-o",
+        "--output",
+        help="File to write the JSON results to, default is standard output",
+    )
+    args = arg_parse.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        print(
+            f"[!] Unknown stages: {', '.join(unknown)}. Choose from {', '.join(STAGES)}"
+        )
+        sys.exit(1)
+    if args.startup:
+        results = environment()
+        results["startup"] = startup()
+        write_results(results, args.output)
+        eager = results["startup"]["eager_imports"]
+        if eager:
+            print(f"[!] Imported at startup: {', '.join(eager)}", file=sys.stderr)
+            sys.exit(1)
+        return
+    with tempfile.TemporaryDirectory(prefix="gtl-bench-") as work_dir:
+        inputs = args.input or []
+        if not inputs:
+            if args.records:
+                inputs.append(os.path.join(work_dir, "Records.json"))
+                print(
+                    f"[-] Generating {args.records} synthetic location records",
+                    file=sys.stderr,
+                )
+                write_records(inputs[-1], args.records, seed=args.seed)
+            if args.timeline:
+                inputs.append(os.path.join(work_dir, "Timeline.json"))
+                print(
+                    f"[-] Generating {args.timeline} synthetic timeline objects",
+                    file=sys.stderr,
+                )
+                write_timeline(inputs[-1], args.timeline, seed=args.seed)
+        results = environment()
+        if args.json_backends:
+            results["json_backends"] = [
+                json_backends(path, args.trace_memory) for path in inputs
+            ]
+        else:
+            results["datasets"] = [
+                benchmark(
+                    path, stages, args.tz, args.batch, args.trace_memory, work_dir
+                )
+                for path in inputs
+            ]
+    write_results(results, args.output)
+    if args.json_backends:
+        differ = {
+            entry["backend"]
+            for dataset in results["json_backends"]
+            for entry in dataset["backends"]
+            if not entry["identical"]
+        }
+        if differ:
+            differ = ", ".join(sorted(differ))
+            print(f"[!] Decoded differently: {differ}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+On-disk cache of parsed records, so that repeat runs over the same export skip JSON parsing.
+
+Each entry is a directory named after the input file's size, modification time and content
+hash. It holds one .npy file per column of the unfiltered UTC store, which is memory mapped on
+load, plus the string tables in meta.json. Timezone, date, time and grid selections are all
+applied after loading, so one entry serves every combination of them. Entries are evicted least
+recently used first once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from .store import LocationStore, StringTable, TimelineStore
+
+CACHE_VERSION = 2
+CACHE_SIZE_MB = 2048
+HASH_CHUNK_SIZE = 1 << 20
+STORE_TYPES = {"locations": LocationStore, "timeline": TimelineStore}
+
+
+def cache_dir():
+    """$GTL_CACHE_DIR, or gtl under $XDG_CACHE_HOME (~/.cache by default)"""
+    if os.environ.get("GTL_CACHE_DIR"):
+        return os.environ["GTL_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "gtl")
+
+
+def cache_key(path):
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as json_file:
+        while chunk := json_file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def entry_size(entry):
+    return sum(
+        os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry)
+    )
+
+
+def load_cache(key, tz="UTC", directory=None):
+    """Returns (store, fmt) for a cached input, or None if it is not cached"""
+    entry = os.path.join(directory or cache_dir(), key)
+    meta_file = os.path.join(entry, "meta.json")
+    try:
+        with open(meta_file, "r", encoding="utf-8") as meta_json:
+            meta = json.load(meta_json)
+        if meta["version"] != CACHE_VERSION:
+            return None
+        store_type = STORE_TYPES[meta["format"]]
+        columns = {
+            name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+            for name in meta["columns"]
+        }
+        tables = {
+            name: StringTable(
+                tuple(value) if isinstance(value, list) else value for value in values
+            )
+            for name, values in meta["tables"].items()
+        }
+        # Marks the entry as recently used for eviction
+        os.utime(meta_file)
+    except (OSError, ValueError, KeyError):
+        return None
+    return store_type(columns, tables, str(tz)), meta["format"]
+
+
+def evict(directory, limit, keep=None):
+    """Removes the least recently used entries until the cache is within limit bytes"""
+    entries = []
+    for name in os.listdir(directory):
+        entry = os.path.join(directory, name)
+        meta_file = os.path.join(entry, "meta.json")
+        if name != keep and os.path.isfile(meta_file):
+            entries.append((os.path.getmtime(meta_file), entry_size(entry), entry))
+    total = sum(size for _, size, _ in entries)
+    if keep:
+        total += entry_size(os.path.join(directory, keep))
+    for _, size, entry in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def save_cache(key, store, fmt, limit=CACHE_SIZE_MB << 20, directory=None):
+    """Writes the store to the cache, unless it alone is larger than the limit"""
+    directory = directory or cache_dir()
+    if store.nbytes > limit:
+        print("[-] Parsed records are larger than the cache limit, not caching")
+        return
+    entry = os.path.join(directory, key)
+    staging = f"{entry}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(staging, exist_ok=True)
+        columns = store.columns
+        for name, column in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), column)
+        meta = {
+            "version": CACHE_VERSION,
+            "format": fmt,
+            "columns": list(columns),
+            "tables": {name: table.values for name, table in store.tables.items()},
+        }
+        with open(
+            os.path.join(staging, "meta.json"), "w", encoding="utf-8"
+        ) as meta_json:
+            json.dump(meta, meta_json)
+        # Another run may have cached the same input in the meantime
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(staging, entry)
+        evict(directory, limit, keep=key)
+    except OSError as err:
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"[!] Unable to write the parse cache: {err}")
@@ -0,0 +1,197 @@
+"""
+Parquet and Arrow IPC output.
+
+Records are written from the store in row groups of typed columns: timestamps as UTC epoch
+milliseconds, coordinates as doubles, repeated text as dictionary (categorical) columns and
+timeline waypoints as a list of latitude/longitude structs. The selected timezone is kept in
+the schema metadata. pyarrow is an optional dependency and is only needed for these formats.
+"""
+
+from .store import E7, KINDS, TimelineStore
+from .timeutil import MISSING_TIMESTAMP
+
+ROW_GROUP_ROWS = 131072
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "Parquet and Arrow output require pyarrow. Install it with 'pip install gtl[arrow]' and try again."
+        ) from None
+    return pyarrow
+
+
+def dictionaries(pa, store):
+    """Builds each dictionary once so that every row group shares the same one"""
+    values = {
+        name: pa.array([str(value) for value in table.values], pa.string())
+        for name, table in store.tables.items()
+    }
+    if isinstance(store, TimelineStore):
+        values["kind"] = pa.array(KINDS, pa.string())
+    if store.region is not None:
+        values["region"] = pa.array(store.region_table.values, pa.string())
+    return values
+
+
+def categorical(pa, codes, dictionary):
+    return pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()), dictionary)
+
+
+def timestamps(pa, epoch_ms):
+    return pa.array(
+        epoch_ms, pa.timestamp("ms", tz="UTC"), mask=epoch_ms == MISSING_TIMESTAMP
+    )
+
+
+def coordinates(pa, values):
+    return pa.array(values / E7, pa.float64())
+
+
+def location_batch(pa, store, start, stop, dictionary):
+    return pa.RecordBatch.from_arrays(
+        [
+            timestamps(pa, store.timestamp[start:stop]),
+            coordinates(pa, store.latitude[start:stop]),
+            coordinates(pa, store.longitude[start:stop]),
+            pa.array(store.accuracy[start:stop], pa.int32()),
+            categorical(pa, store.source[start:stop], dictionary["source"]),
+            categorical(pa, store.device_tag[start:stop], dictionary["device_tag"]),
+            categorical(
+                pa,
+                store.device_designation[start:stop],
+                dictionary["device_designation"],
+            ),
+            timestamps(pa, store.activity_timestamp[start:stop]),
+            pa.array(
+                [
+                    "|".join(motions) if motions else None
+                    for motions in store.decode("motions", start, stop)
+                ],
+                pa.string(),
+            ),
+        ],
+        names=[
+            "timestamp",
+            "latitude",
+            "longitude",
+            "accuracy",
+            "source",
+            "deviceTag",
+            "deviceDesignation",
+            "activity_timestamp",
+            "motions",
+        ],
+    )
+
+
+def timeline_batch(pa, store, start, stop, dictionary):
+    offsets = store.waypoint_offsets[start : stop + 1]
+    points = slice(offsets[0], offsets[-1])
+    waypoints = pa.ListArray.from_arrays(
+        pa.array(offsets - offsets[0], pa.int32()),
+        pa.StructArray.from_arrays(
+            [
+                coordinates(pa, store.waypoint_latitude[points]),
+                coordinates(pa, store.waypoint_longitude[points]),
+            ],
+            names=["latitude", "longitude"],
+        ),
+    )
+    return pa.RecordBatch.from_arrays(
+        [
+            categorical(pa, store.kind[start:stop], dictionary["kind"]),
+            timestamps(pa, store.start_timestamp[start:stop]),
+            coordinates(pa, store.start_latitude[start:stop]),
+            coordinates(pa, store.start_longitude[start:stop]),
+            waypoints,
+            coordinates(pa, store.end_latitude[start:stop]),
+            coordinates(pa, store.end_longitude[start:stop]),
+            timestamps(pa, store.end_timestamp[start:stop]),
+            categorical(pa, store.activity_type[start:stop], dictionary["activity_type"]),
+            categorical(pa, store.confidence[start:stop], dictionary["confidence"]),
+            categorical(pa, store.source[start:stop], dictionary["source"]),
+            pa.array(
+                [list(detail) for detail in store.decode("detail", start, stop)],
+                pa.list_(pa.string()),
+            ),
+        ],
+        names=[
+            "kind",
+            "start_time",
+            "start_lat",
+            "start_long",
+            "waypoints",
+            "end_lat",
+            "end_long",
+            "end_time",
+            "activity_place_type",
+            "confidence",
+            "source",
+            "detail",
+        ],
+    )
+
+
+def with_regions(pa, batch, store, start, stop, dictionary):
+    if store.region is None:
+        return batch
+    return batch.append_column(
+        "region", categorical(pa, store.region[start:stop], dictionary["region"])
+    )
+
+
+def record_batches(pa, store, row_group_rows=ROW_GROUP_ROWS):
+    """Yields the store as record batches of at most row_group_rows rows, and at least one
+    (possibly empty) batch so that the schema is always known"""
+    dictionary = dictionaries(pa, store)
+    make_batch = (
+        timeline_batch if isinstance(store, TimelineStore) else location_batch
+    )
+    for start in range(0, max(len(store), 1), row_group_rows):
+        stop = min(start + row_group_rows, len(store))
+        batch = make_batch(pa, store, start, stop, dictionary)
+        yield with_regions(pa, batch, store, start, stop, dictionary)
+
+
+def write_parquet(filename, store, row_group_rows=ROW_GROUP_ROWS, progress_line=None):
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+
+    output_file = f"{filename}.parquet"
+    writer = None
+    try:
+        for batch in record_batches(pa, store, row_group_rows):
+            if writer is None:
+                schema = batch.schema.with_metadata({"timezone": store.tz})
+                writer = pq.ParquetWriter(output_file, schema)
+            writer.write_batch(batch)
+            if progress_line:
+                progress_line.advance(batch.num_rows)
+        writer.close()
+    except Exception as err:
+        raise OSError(f"Unable to write Parquet: {err}") from err
+    print(f"[+] Parquet file generated - {output_file}")
+    return [output_file]
+
+
+def write_arrow(filename, store, row_group_rows=ROW_GROUP_ROWS, progress_line=None):
+    pa = require_pyarrow()
+
+    output_file = f"{filename}.arrow"
+    writer = None
+    try:
+        for batch in record_batches(pa, store, row_group_rows):
+            if writer is None:
+                schema = batch.schema.with_metadata({"timezone": store.tz})
+                writer = pa.ipc.new_file(output_file, schema)
+            writer.write_batch(batch)
+            if progress_line:
+                progress_line.advance(batch.num_rows)
+        writer.close()
+    except Exception as err:
+        raise OSError(f"Unable to write Arrow: {err}") from err
+    print(f"[+] Arrow file generated - {output_file}")
+    return [output_file]
@@ -0,0 +1,68 @@
+"""
+Spatio-temporal decimation of raw location fixes.
+
+A phone that sits still keeps reporting fixes every few seconds, all a few metres apart. Each
+device's fixes are followed in time order, and a fix is dropped when it lands in the same grid
+cell of min_distance metres as the fix before it, unless it is the first of a new min_interval
+seconds of that stay in the cell. Every move into another cell is kept, so movement survives
+while long stays collapse to one fix (or one fix per min_interval). Fixes whose accuracy radius
+is larger than max_accuracy metres are dropped first. All of it is evaluated over whole columns:
+cell changes are found by comparing each fix with the previous one, and the fixes kept within a
+stay by bucketing their time since the stay began.
+"""
+
+import numpy as np
+from .spatial import METRES_PER_DEGREE, METRES_PER_E7
+
+
+def grid_cells(latitude, longitude, metres):
+    """Returns the row and column of the cell of about metres square that each E7 coordinate
+    falls in. Columns are narrowed towards the poles by the latitude of their row."""
+    rows = np.floor(latitude * (METRES_PER_E7 / metres)).astype(np.int64)
+    row_latitude = np.radians((rows + 0.5) * metres / METRES_PER_DEGREE)
+    widths = np.cos(np.clip(row_latitude, -np.pi / 2, np.pi / 2)) * METRES_PER_E7
+    columns = np.floor(longitude * widths / metres).astype(np.int64)
+    return rows, columns
+
+
+def decimate(store, min_distance=None, min_interval=None, max_accuracy=None):
+    """Returns the LocationStore without the dropped fixes, the number dropped for their
+    accuracy and the number dropped as repeats. min_interval is in seconds, the others in
+    metres; each one left as None does not apply."""
+    inaccurate = 0
+    if max_accuracy is not None:
+        accurate = store.accuracy <= max_accuracy
+        inaccurate = len(store) - int(np.count_nonzero(accurate))
+        if inaccurate:
+            store = store.take(accurate)
+    if len(store) < 2 or not (min_distance or min_interval):
+        return store, inaccurate, 0
+    # Follow each device on its own; a single device is already in time order
+    order = None
+    if len(store.device_tag_table) > 1:
+        order = np.lexsort((store.timestamp, store.device_tag))
+    timestamps = store.timestamp
+    latitude, longitude = store.latitude, store.longitude
+    if order is not None:
+        timestamps = timestamps[order]
+        latitude, longitude = latitude[order], longitude[order]
+        devices = store.device_tag[order]
+    # moved marks the first fix of each stay: a new device, or a new cell
+    moved = np.zeros(len(store), dtype=bool)
+    moved[0] = True
+    if order is not None:
+        moved[1:] |= devices[1:] != devices[:-1]
+    if min_distance:
+        rows, columns = grid_cells(latitude, longitude, min_distance)
+        moved[1:] |= (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    keep = moved.copy()
+    if min_interval:
+        arrived = timestamps[moved][np.cumsum(moved) - 1]
+        windows = (timestamps - arrived) // max(1, round(min_interval * 1000))
+        keep[1:] |= windows[1:] != windows[:-1]
+    if order is not None:
+        keep[order] = keep.copy()
+    repeated = len(store) - int(np.count_nonzero(keep))
+    if repeated:
+        store = store.take(keep)
+    return store, inaccurate, repeated
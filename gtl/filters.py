@@ -0,0 +1,141 @@
+"""
+Vectorized search grid, date range and time of day filtering over parsed records.
+
+The ranges given on the command line are parsed once into integer bounds, and each filter is
+then evaluated over whole columns of coordinates and epoch timestamps at a time.
+"""
+
+from datetime import datetime as dt, time
+import numpy as np
+from .store import E7, TimelineStore
+from .timeutil import MAX_UTC_OFFSET_MS, local_epoch_ms
+
+DAY_MS = 86400000
+EPOCH_DATE = dt(1970, 1, 1).date()
+
+
+def create_search_grid(coord1, coord2):
+    lat1, long1 = coord1
+    lat2, long2 = coord2
+
+    return (
+        min(lat1, lat2),
+        max(lat1, lat2),
+        min(long1, long2),
+        max(long1, long2),
+    )
+
+
+def split_range(value, example):
+    """Splits a START..END range, raising ValueError with the expected format otherwise"""
+    start, sep, end = value.partition("..")
+    if not (sep and start and end) or ".." in end:
+        raise ValueError(
+            f"Make sure your range {value!r} is {example}..{example}"
+            " and surround it with quotes"
+        )
+    return start, end
+
+
+def time_of_day_ms(value):
+    parsed = time.fromisoformat(value)
+    return (
+        (parsed.hour * 3600 + parsed.minute * 60 + parsed.second) * 1000
+        + parsed.microsecond // 1000
+    )
+
+
+class SearchFilter:
+    """Holds the parsed search grid, date range and time range, and returns boolean masks
+    for whole columns of records. An omitted range does not restrict the results."""
+
+    def __init__(self, tz="UTC", date_range=None, time_range=None, search_grid=None):
+        self.tz = str(tz)
+        self.bounds = None
+        self.date_bounds = None
+        self.time_bounds = None
+        if search_grid:
+            self.bounds = create_search_grid(search_grid[1], search_grid[0])
+        if date_range:
+            start_date, end_date = split_range(date_range, "YYYY-MM-DD")
+            try:
+                self.date_bounds = (
+                    (dt.fromisoformat(start_date).date() - EPOCH_DATE).days,
+                    (dt.fromisoformat(end_date).date() - EPOCH_DATE).days,
+                )
+            except ValueError as err:
+                raise ValueError(f"Invalid date range {date_range!r}: {err}") from err
+        if time_range:
+            start_time, end_time = split_range(time_range, "HH:MM:SS")
+            try:
+                self.time_bounds = (time_of_day_ms(start_time), time_of_day_ms(end_time))
+            except ValueError as err:
+                raise ValueError(f"Invalid time range {time_range!r}: {err}") from err
+
+    @property
+    def active(self):
+        return bool(self.bounds or self.date_bounds or self.time_bounds)
+
+    def within_grid(self, latitude, longitude):
+        """Latitude and longitude are E7 integer columns"""
+        min_lat, max_lat, min_long, max_long = self.bounds
+        lat = latitude / E7
+        long = longitude / E7
+        return (min_lat <= lat) & (lat <= max_lat) & (min_long <= long) & (long <= max_long)
+
+    def within_window(self, epoch_ms):
+        """Checks the date and time of day of each timestamp in the selected timezone"""
+        mask = np.ones(len(epoch_ms), dtype=bool)
+        if not (self.date_bounds or self.time_bounds):
+            return mask
+        local = local_epoch_ms(epoch_ms, self.tz)
+        if self.date_bounds:
+            days = local // DAY_MS
+            mask &= (days >= self.date_bounds[0]) & (days <= self.date_bounds[1])
+        if self.time_bounds:
+            start, end = self.time_bounds
+            elapsed = local % DAY_MS
+            if start <= end:
+                mask &= (elapsed >= start) & (elapsed <= end)
+            else:
+                # A window such as 22:00:00..06:00:00 wraps past midnight
+                mask &= (elapsed >= start) | (elapsed <= end)
+        return mask
+
+    def mask_points(self, latitude, longitude, epoch_ms):
+        mask = self.within_window(epoch_ms)
+        if self.bounds:
+            mask &= self.within_grid(latitude, longitude)
+        return mask
+
+    def mask(self, store):
+        """Timeline entries are kept when either their start or their end is in scope"""
+        if not isinstance(store, TimelineStore):
+            return self.mask_points(store.latitude, store.longitude, store.timestamp)
+        mask = np.ones(len(store), dtype=bool)
+        if self.bounds:
+            mask &= self.within_grid(
+                store.start_latitude, store.start_longitude
+            ) | self.within_grid(store.end_latitude, store.end_longitude)
+        if self.date_bounds or self.time_bounds:
+            mask &= self.within_window(store.start_timestamp) | self.within_window(
+                store.end_timestamp
+            )
+        return mask
+
+    def utc_window(self):
+        """Returns UTC epoch millisecond bounds which cover the date range in any timezone"""
+        first_day, last_day = self.date_bounds
+        return (
+            first_day * DAY_MS - MAX_UTC_OFFSET_MS,
+            (last_day + 1) * DAY_MS + MAX_UTC_OFFSET_MS,
+        )
+
+    def apply(self, store):
+        """With a date range, the records around it are first sliced out of the store through
+        its time index, so the other filters only look at that slice"""
+        if not self.active:
+            return store
+        if self.date_bounds:
+            store = store.take(store.time_index().between(*self.utc_window()))
+        return store.take(self.mask(store))
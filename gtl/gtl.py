@@ -10,29 +10,180 @@ https://earth.google.com/web and the PC application.
 
 """
 
+import csv
+import glob
 import json
 import os
+import re
 import sys
 import argparse
-from datetime import datetime as dt, timezone, time
-from zoneinfo import ZoneInfo, available_timezones
-import pandas as pd
-import simplekml
+from functools import partial
+from itertools import islice, repeat
+from datetime import datetime as dt
+from zoneinfo import available_timezones
+from .store import (
+    E7,
+    ACTIVITY_SEGMENT,
+    PLACE_VISIT,
+    LocationBuilder,
+    TimelineBuilder,
+)
+from .filters import SearchFilter
+from .timeutil import format_datetimes, format_isoformat
+from .kml import write_kml
+from .overlay import write_super_overlay
+from .columnar import write_parquet, write_arrow
+from .cache import CACHE_SIZE_MB, cache_key, load_cache, save_cache
+from .spatial import load_regions, search_regions
+from .stats import Stats, progress, stage
+from .simplify import simplify_paths
+from .decimate import decimate
+from .segment import STAY_RADIUS_M, STAY_SECONDS, segment_locations
+from .jsonbackend import BACKENDS, load_json, select_backend
 
 __author__ = "Corey Forman (digitalsleuth)"
 __version__ = "3.0"
 __date__ = "30 Apr 2025"
 __description__ = "Google Takeout Location JSON parser"
 
+RECORD_KEYS = ("timelineObjects", "locations")
+STREAM_CHUNK_SIZE = 1 << 20
+EXCEL_MAX_ROWS = 1048576
+EXCEL_BLOCK_ROWS = 65536
+TIMELINE_HEADER = [
+    "start_epoch",
+    "start_time",
+    "start_lat",
+    "start_long",
+    "waypoints",
+    "end_lat",
+    "end_long",
+    "end_epoch",
+    "end_time",
+    "timezone",
+    "activity_place_type",
+    "confidence",
+    "source",
+    "detail",
+]
+LOCATION_HEADER = [
+    "timestamp",
+    "timezone",
+    "latitude",
+    "longitude",
+    "accuracy",
+    "source",
+    "deviceTag",
+    "deviceDesignation",
+    "activity_timestamp",
+    "motions",
+]
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
 
-def ingest(json_file):
+
+def ingest(json_file, json_backend=None):
+    """Decodes the whole file with the named backend, or the fastest one installed"""
+    return load_json(json_file, json_backend)
+
+
+class JsonStream:
+    """Reads a json document from an open file in fixed size chunks, decoding one value at a time"""
+
+    def __init__(self, json_data, chunk_size=STREAM_CHUNK_SIZE):
+        self.json_data = json_data
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.json_data.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number cut at the end of the buffer decodes as its prefix (1 of 1.25), so
+            # it is only complete once something other than a number follows it
+            truncated = end == len(self.buffer) or (
+                isinstance(obj, (int, float))
+                and NUMBER_TAIL.match(self.buffer, end) is not None
+            )
+            if truncated and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def stream_records(json_file, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the name of the first record array found, followed by each of its elements"""
     with open(json_file, "r", encoding="utf-8") as json_data:
-        results = json.load(json_data)
-    return results
+        stream = JsonStream(json_data, chunk_size)
+        stream.expect("{")
+        while stream.peek() not in ("}", ""):
+            key = stream.value()
+            stream.expect(":")
+            if key not in RECORD_KEYS:
+                stream.value()
+                if stream.peek() == ",":
+                    stream.pos += 1
+                continue
+            yield key
+            stream.expect("[")
+            if stream.peek() == "]":
+                return
+            while True:
+                yield stream.value()
+                separator = stream.peek()
+                stream.pos += 1
+                if separator == "]":
+                    return
+                if separator != ",":
+                    raise json.JSONDecodeError(
+                        "Expecting ',' delimiter", stream.buffer, stream.pos - 1
+                    )
+
+
+def stream_ingest(json_file, chunk_size=STREAM_CHUNK_SIZE):
+    """Returns a mapping of the record key to a generator of its elements, so that the
+    parsers can consume the file one record at a time instead of loading it all at once"""
+    records = stream_records(json_file, chunk_size)
+    key = next(records, None)
+    if key is None:
+        return {}
+    return {key: records}
 
 
-def generate_kml(filename, all_data, fmt, batch):
+def generate_kml(filename, store, fmt, batch, waypoint_points=True):
     """Generates a KML file from the trip data"""
+    import simplekml
+
     normal_icon = "https://www.gstatic.com/mapspro/images/stock/503-wht-blank_maps.png"
     highlight_icon = (
         "https://www.gstatic.com/mapspro/images/stock/503-wht-blank_maps.png"
@@ -46,7 +197,27 @@ def generate_kml(filename, all_data, fmt, batch):
     kml = simplekml.Kml()
     range_start = None
     range_end = None
-    for i, this_trip in enumerate(all_data, start=1):
+    paths = []
+    for i in range(1, len(store) + 1):
+        idx = i - 1
+        offset = idx % batch_size
+        if offset == 0:
+            # Timestamps are formatted for the selected timezone one batch at a time
+            batch_stop = idx + batch_size
+            if fmt == "timeline":
+                start_times = format_datetimes(
+                    store.start_timestamp[idx:batch_stop], store.tz
+                )
+                end_times = format_datetimes(
+                    store.end_timestamp[idx:batch_stop], store.tz
+                )
+            elif fmt == "locations":
+                location_times = format_isoformat(
+                    store.timestamp[idx:batch_stop], store.tz
+                )
+                activity_times = format_isoformat(
+                    store.activity_timestamp[idx:batch_stop], store.tz, zulu=True
+                )
         folder = kml.newfolder()
         plot = folder.newlinestring(name=f"{map_type} {i}", tessellate=1)
         plot.stylemap.normalstyle.labelstyle.scale = 0
@@ -71,8 +242,12 @@ def generate_kml(filename, all_data, fmt, batch):
         plot.stylemap.highlightstyle.linestyle.width = 7.5
         this_trip_coords = []
         if fmt == "timeline":
-            start_time = this_trip[1]
-            end_time = this_trip[8]
+            start_time = start_times[offset]
+            end_time = end_times[offset]
+            activity_type = store.activity_type_table[store.activity_type[idx]]
+            confidence = store.confidence_table[store.confidence[idx]]
+            source = store.source_table[store.source[idx]]
+            detail = " ".join(store.detail_table[store.detail[idx]])
             if range_start is None:
                 range_start = start_time.split(" ")[0]
             balloon_text = f"""
@@ -82,9 +257,9 @@ def generate_kml(filename, all_data, fmt, batch):
             <p>Starts at {start_time}</p>
             <p>Ends at {end_time}</p>
             <p>Details:</p>
-            <p>{' '.join(this_trip[13])}</p>
-            <p>Activity / Place: {this_trip[10]}</p>
-            <p>Confidence: {this_trip[11]}</p>
+            <p>{detail}</p>
+            <p>Activity / Place: {activity_type}</p>
+            <p>Confidence: {confidence}</p>
         </div>
     ]]>
     """
@@ -92,38 +267,51 @@ def generate_kml(filename, all_data, fmt, batch):
             plot.stylemap.highlightstyle.balloonstyle.bgcolor = simplekml.Color.white
             plot.stylemap.highlightstyle.balloonstyle.textcolor = simplekml.Color.black
             plot.description = ""
-            this_trip_coords.append((this_trip[3], this_trip[2]))
-            if this_trip[4]:
-                for coord in this_trip[4]:
-                    this_trip_coords.append((coord[1], coord[0]))
-            this_trip_coords.append((this_trip[6], this_trip[5]))
+            this_trip_coords.append(
+                (
+                    coordinate(store.start_longitude[idx]),
+                    coordinate(store.start_latitude[idx]),
+                )
+            )
+            for lat, long in store.waypoints(idx):
+                this_trip_coords.append((coordinate(long), coordinate(lat)))
+            this_trip_coords.append(
+                (
+                    coordinate(store.end_longitude[idx]),
+                    coordinate(store.end_latitude[idx]),
+                )
+            )
             for coord in this_trip_coords:
                 plot.description += f"{coord[0]},{coord[1]}\n"
             coord_len = len(this_trip_coords)
             plot.coords = this_trip_coords
             start_point = folder.newpoint(
-                name=f"Start - {start_time} - {this_trip[10]} - Confidence {this_trip[11]} - Source {this_trip[12]}"
+                name=f"Start - {start_time} - {activity_type} - Confidence {confidence} - Source {source}"
             )
             start_point.coords = [this_trip_coords[0]]
             start_point.style.iconstyle.icon.href = (
                 "http://maps.google.com/mapfiles/kml/paddle/A.png"
             )
-            if coord_len > 2:
-                for each in this_trip_coords[1 : coord_len - 1]:
-                    wpt_num = this_trip_coords.index(each)
+            if coord_len > 2 and waypoint_points:
+                for wpt_num, each in enumerate(
+                    this_trip_coords[1 : coord_len - 1], start=1
+                ):
                     folder.newpoint(name=f"Waypoint {wpt_num}", coords=[each])
             end_point = folder.newpoint(name=f"End - {end_time}")
             end_point.coords = [this_trip_coords[-1]]
             end_point.style.iconstyle.icon.href = (
                 "http://maps.google.com/mapfiles/kml/paddle/B.png"
             )
-            folder.name = f"Trip {i} - {start_time} - {end_time} - {this_trip[10]} - {' '.join(this_trip[13])}"
+            folder.name = f"Trip {i} - {start_time} - {end_time} - {activity_type} - {detail}"
             if i % batch_size == 0:
                 range_end = end_time.split(" ")[0]
                 try:
                     kml.save(
                         f"{filename}_{range_start}_{range_end}_{i//batch_size}.kml"
                     )
+                    paths.append(
+                        f"{filename}_{range_start}_{range_end}_{i//batch_size}.kml"
+                    )
                     kml = simplekml.Kml()
                     print(
                         f"[+] KML file generated - {filename}_{range_start}_{range_end}_{i//batch_size}.kml"
@@ -133,16 +321,13 @@ def generate_kml(filename, all_data, fmt, batch):
                 except Exception as err:
                     print(f"[!] Error encountered trying to save KML file - {err}")
         elif fmt == "locations":
-            location_timestamp = this_trip[0]
+            location_timestamp = location_times[offset]
             if range_start is None:
-                range_start = dt.fromisoformat(
-                    location_timestamp.replace("Z", "+00:00")
-                ).strftime("%Y-%m-%d")
-            if this_trip[8] != "None":
-                activity_timestamp = this_trip[8][0][0]
-                motion_details = ",".join(this_trip[8][0][1])
-            else:
-                activity_timestamp = motion_details = this_trip[8]
+                range_start = location_timestamp[:10]
+            activity_timestamp = activity_times[offset]
+            motion_details = ",".join(store.motions_table[store.motions[idx]])
+            if not motion_details:
+                motion_details = "None"
             balloon_text = f"""
     <![CDATA[
         <div style="width: 300px;">
@@ -157,7 +342,9 @@ def generate_kml(filename, all_data, fmt, batch):
             plot.stylemap.highlightstyle.balloonstyle.bgcolor = simplekml.Color.white
             plot.stylemap.highlightstyle.balloonstyle.textcolor = simplekml.Color.black
             plot.description = ""
-            this_trip_coords.append((this_trip[3], this_trip[2]))
+            this_trip_coords.append(
+                (coordinate(store.longitude[idx]), coordinate(store.latitude[idx]))
+            )
             for coord in this_trip_coords:
                 plot.description += f"{coord[0]},{coord[1]}\n"
             plot.coords = this_trip_coords
@@ -166,15 +353,16 @@ def generate_kml(filename, all_data, fmt, batch):
             plot_point.style.iconstyle.icon.href = (
                 "http://maps.google.com/mapfiles/kml/paddle/blu-blank.png"
             )
-            folder.name = f"{map_type} {i} - {location_timestamp}/{activity_timestamp} - Accuracy {this_trip[4]} - Type (T) / Confidence (C) {motion_details} - Source {this_trip[5]}"
+            folder.name = f"{map_type} {i} - {location_timestamp}/{activity_timestamp} - Accuracy {store.accuracy[idx]} - Type (T) / Confidence (C) {motion_details} - Source {store.source_table[store.source[idx]]}"
             if i % batch_size == 0:
-                range_end = dt.fromisoformat(
-                    location_timestamp.replace("Z", "+00:00")
-                ).strftime("%Y-%m-%d")
+                range_end = location_timestamp[:10]
                 try:
                     kml.save(
                         f"{filename}_{range_start}_{range_end}_{i//batch_size}.kml"
                     )
+                    paths.append(
+                        f"{filename}_{range_start}_{range_end}_{i//batch_size}.kml"
+                    )
                     print(
                         f"[+] KML file generated - {filename}_{range_start}_{range_end}_{i//batch_size}.kml"
                     )
@@ -190,66 +378,29 @@ def generate_kml(filename, all_data, fmt, batch):
             filename = f"{filename}_{range_start}_{range_end}_final.kml"
         try:
             kml.save(f"{filename}")
+            paths.append(filename)
             print(f"[+] KML file generated - {filename}")
         except Exception as err:
             print(f"[!] Error encountered trying to save KML file - {err}")
+    return paths
 
 
 def get_timeline_objects(
     loaded_json, tz="UTC", date_range=None, time_range=None, search_grid=None
 ):
-    parsed_data = []
-    if search_grid:
-        bounds = create_search_grid(search_grid[1], search_grid[0])
-    else:
-        bounds = None
+    parsed_data = TimelineBuilder(str(tz))
     for item in loaded_json["timelineObjects"]:
         wpts = []
-        pts = []
         detail = []
         probability = None
         if "activitySegment" in item:
             act = item["activitySegment"]
-            loc_start_lat = float(act["startLocation"]["latitudeE7"] / 10000000)
-            loc_start_long = float(act["startLocation"]["longitudeE7"] / 10000000)
-            loc_end_lat = float(act["endLocation"]["latitudeE7"] / 10000000)
-            loc_end_long = float(act["endLocation"]["longitudeE7"] / 10000000)
-            if bounds:
-                start_in_grid = within_search_grid(
-                    loc_start_lat, loc_start_long, bounds
-                )
-                end_in_grid = within_search_grid(loc_end_lat, loc_end_long, bounds)
-                if not (start_in_grid or end_in_grid):
-                    continue
+            loc_start_lat = act["startLocation"]["latitudeE7"]
+            loc_start_long = act["startLocation"]["longitudeE7"]
+            loc_end_lat = act["endLocation"]["latitudeE7"]
+            loc_end_long = act["endLocation"]["longitudeE7"]
             start_ms = int(act["duration"]["startTimestampMs"])
-            start_time = dt.fromtimestamp(
-                int(act["duration"]["startTimestampMs"]) / 1000, timezone.utc
-            )
             end_ms = int(act["duration"]["endTimestampMs"])
-            end_time = dt.fromtimestamp(
-                int(act["duration"]["endTimestampMs"]) / 1000, timezone.utc
-            )
-            if tz != "UTC":
-                tz = ZoneInfo(str(tz))
-                start_time = start_time.replace(tzinfo=timezone.utc)
-                start_time = start_time.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S")
-                end_time = end_time.replace(tzinfo=timezone.utc)
-                end_time = end_time.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                start_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
-                end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
-            if date_range and time_range:
-                start_date_in_scope, start_time_in_scope = date_filter(
-                    start_time, date_range, time_range, tz
-                )
-                end_date_in_scope, end_time_in_scope = date_filter(
-                    end_time, date_range, time_range, tz
-                )
-                if not (
-                    (start_date_in_scope and start_time_in_scope)
-                    or (end_date_in_scope and end_time_in_scope)
-                ):
-                    continue
             if (
                 "sourceInfo" in act["startLocation"]
                 and "sourceInfo" in act["endLocation"]
@@ -266,21 +417,11 @@ def get_timeline_objects(
             if "waypointPath" in act:
                 waypoints = act["waypointPath"]["waypoints"]
                 for waypoint in waypoints:
-                    wpts.append(
-                        [
-                            f"{float(waypoint['latE7'] / 10000000)}",
-                            f"{float(waypoint['lngE7'] / 10000000)}",
-                        ]
-                    )
+                    wpts.append((waypoint["latE7"], waypoint["lngE7"]))
             if "simplifiedRawPath" in act:
                 points = act["simplifiedRawPath"]["points"]
                 for point in points:
-                    wpts.append(
-                        [
-                            f"{float(point['latE7'] / 10000000)}",
-                            f"{float(point['lngE7'] / 10000000)}",
-                        ]
-                    )
+                    wpts.append((point["latE7"], point["lngE7"]))
             if "distance" in act:
                 detail.append(f"Distance: {act['distance']}")
             probabilities = act["activities"]
@@ -294,60 +435,26 @@ def get_timeline_objects(
                 detail.append("Probability: unknown")
 
             parsed_data.append(
-                [
-                    start_ms,
-                    start_time,
-                    loc_start_lat,
-                    loc_start_long,
-                    wpts,
-                    loc_end_lat,
-                    loc_end_long,
-                    end_ms,
-                    end_time,
-                    tz,
-                    activity_type,
-                    confidence,
-                    source,
-                    detail,
-                ]
+                ACTIVITY_SEGMENT,
+                start_ms,
+                end_ms,
+                loc_start_lat,
+                loc_start_long,
+                loc_end_lat,
+                loc_end_long,
+                wpts,
+                activity_type,
+                confidence,
+                source,
+                tuple(detail),
             )
         if "placeVisit" in item:
             place = item["placeVisit"]
             location = place["location"]
-            loc_lat = float(location["latitudeE7"] / 10000000)
-            loc_long = float(location["longitudeE7"] / 10000000)
-            if bounds:
-                if not within_search_grid(loc_lat, loc_long, bounds):
-                    continue
+            loc_lat = location["latitudeE7"]
+            loc_long = location["longitudeE7"]
             start_ms = int(place["duration"]["startTimestampMs"])
-            start_time = dt.fromtimestamp(
-                int(place["duration"]["startTimestampMs"]) / 1000, timezone.utc
-            )
             end_ms = int(place["duration"]["endTimestampMs"])
-            end_time = dt.fromtimestamp(
-                int(place["duration"]["endTimestampMs"]) / 1000, timezone.utc
-            )
-            if tz != "UTC":
-                tz = ZoneInfo(str(tz))
-                start_time = start_time.replace(tzinfo=timezone.utc)
-                start_time = start_time.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S")
-                end_time = end_time.replace(tzinfo=timezone.utc)
-                end_time = end_time.astimezone(tz).strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                start_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
-                end_time = end_time.strftime("%Y-%m-%d %H:%M:%S")
-            if date_range or time_range:
-                start_date_in_scope, start_time_in_scope = date_filter(
-                    start_time, date_range, time_range, tz
-                )
-                end_date_in_scope, end_time_in_scope = date_filter(
-                    end_time, date_range, time_range, tz
-                )
-                if not (
-                    (start_date_in_scope and start_time_in_scope)
-                    or (end_date_in_scope and end_time_in_scope)
-                ):
-                    continue
             place_id = location["placeId"]
             address = location["address"]
             loc_name = location["name"]
@@ -360,66 +467,48 @@ def get_timeline_objects(
                 loc_type = location["semanticType"].replace("TYPE_", "")
             else:
                 loc_type = "NO_LOCATION_TYPE"
-            source = location["sourceInfo"]
+            source = str(location["sourceInfo"])
             confidence = place["placeConfidence"].replace("_CONFIDENCE", "")
             if "simplifiedRawPath" in place:
                 path = place["simplifiedRawPath"]
                 for point in path["points"]:
-                    pts.append(
-                        [
-                            f"{float(point['latE7'] / 10000000)}",
-                            f"{float(point['lngE7'] / 10000000)}",
-                        ]
-                    )
+                    wpts.append((point["latE7"], point["lngE7"]))
 
             parsed_data.append(
-                [
-                    start_ms,
-                    start_time,
-                    loc_lat,
-                    loc_long,
-                    pts,
-                    loc_lat,
-                    loc_long,
-                    end_ms,
-                    end_time,
-                    tz,
-                    loc_type,
-                    confidence,
-                    source,
-                    detail,
-                ]
+                PLACE_VISIT,
+                start_ms,
+                end_ms,
+                loc_lat,
+                loc_long,
+                loc_lat,
+                loc_long,
+                wpts,
+                loc_type,
+                confidence,
+                source,
+                tuple(detail),
             )
-    return parsed_data
+    search_filter = SearchFilter(tz, date_range, time_range, search_grid)
+    return search_filter.apply(parsed_data.build())
 
 
 def get_locations(
-    loaded_json, tz="UTC", date_range=None, time_range=None, search_grid=None
+    loaded_json,
+    tz="UTC",
+    date_range=None,
+    time_range=None,
+    search_grid=None,
+    memory_budget=None,
+    spill_dir=None,
+    stats=None,
 ):
-    parsed_data = []
-    if search_grid:
-        bounds = create_search_grid(search_grid[1], search_grid[0])
-    else:
-        bounds = None
+    parsed_data = LocationBuilder(
+        str(tz), memory_budget=memory_budget, spill_dir=spill_dir
+    )
     for location in loaded_json["locations"]:
-        locLat = float(location["latitudeE7"] / 10000000)
-        locLong = float(location["longitudeE7"] / 10000000)
-        if bounds:
-            if not within_search_grid(float(locLat), float(locLong), bounds):
-                continue
-        timestamp = dt.fromisoformat(location["timestamp"]).isoformat(
-            timespec="milliseconds"
-        )
-        if tz != "UTC":
-            tz = ZoneInfo(str(tz))
-            timestamp = dt.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
-            timestamp = timestamp.astimezone(tz).isoformat(timespec="milliseconds")
-        if date_range or time_range:
-            date_in_scope, time_in_scope = date_filter(
-                timestamp, date_range, time_range, tz
-            )
-            if not (date_in_scope and time_in_scope):
-                continue
+        locLat = location["latitudeE7"]
+        locLong = location["longitudeE7"]
+        timestamp = location["timestamp"]
         locAccuracy = location["accuracy"]
         source = location["source"]
         deviceTag = location["deviceTag"]
@@ -427,49 +516,54 @@ def get_locations(
             deviceDesignation = location["deviceDesignation"]
         else:
             deviceDesignation = "None"
-        activity_details = []
+        activity_timestamp = None
         motion_details = []
         if "activity" in location:
             activities = location["activity"]
             for each_activity in activities:
                 activity = each_activity["activity"]
                 activity_timestamp = each_activity["timestamp"]
-                if tz != "UTC":
-                    tz = ZoneInfo(str(tz))
-                    activity_timestamp = dt.fromisoformat(activity_timestamp).replace(
-                        tzinfo=timezone.utc
-                    )
-                    activity_timestamp = activity_timestamp.astimezone(tz).isoformat(
-                        timespec="milliseconds"
-                    )
                 for motion in activity:
                     motion_type = motion["type"]
                     motion_confidence = motion["confidence"]
                     motion_details.append(f"T:{motion_type}-C:{motion_confidence}")
-            activity_details.append([activity_timestamp, motion_details])
-        if not activity_details:
-            activity_details = "None"
 
         parsed_data.append(
-            [
-                timestamp,
-                tz,
-                locLat,
-                locLong,
-                locAccuracy,
-                source,
-                deviceTag,
-                deviceDesignation,
-                activity_details,
-            ]
+            timestamp,
+            locLat,
+            locLong,
+            locAccuracy,
+            source,
+            deviceTag,
+            deviceDesignation,
+            activity_timestamp,
+            tuple(motion_details),
         )
-    sorted_data = sorted(parsed_data, key=lambda row: dt.fromisoformat(row[0]))
-    return sorted_data
+    search_filter = SearchFilter(tz, date_range, time_range, search_grid)
+    with stage(stats, "sort"):
+        return search_filter.apply(parsed_data.build()).sort_by("timestamp")
+
+
+def coordinate(value):
+    return int(value) / E7
 
 
 def parse_json(
-    loaded_json, tz="UTC", date_range=None, time_range=None, search_grid=None
+    loaded_json,
+    tz="UTC",
+    date_range=None,
+    time_range=None,
+    search_grid=None,
+    memory_budget=None,
+    spill_dir=None,
+    stats=None,
+    progress_line=None,
 ):
+    """progress_line, a stats.Progress, is advanced as each record is parsed"""
+    if progress_line:
+        loaded_json = {
+            key: progress_line.wrap(records) for key, records in loaded_json.items()
+        }
     if "timelineObjects" in loaded_json:
         parsed_data = get_timeline_objects(
             loaded_json,
@@ -486,151 +580,308 @@ def parse_json(
             date_range=date_range,
             time_range=time_range,
             search_grid=search_grid,
+            memory_budget=memory_budget,
+            spill_dir=spill_dir,
+            stats=stats,
         )
         fmt = "locations"
     else:
-        print("[!] Unable to find 'timelineObjects' or 'locations' in the JSON file.")
-        sys.exit(1)
+        raise ValueError(
+            "Unable to find 'timelineObjects' or 'locations' in the JSON file."
+        )
     return parsed_data, fmt
 
 
-def generate_excel(filename, parsed_data, fmt):
-    if fmt == "timeline":
-        header = [
-            "start_epoch",
-            "start_time",
-            "start_lat",
-            "start_long",
-            "waypoints",
-            "end_lat",
-            "end_long",
-            "end_epoch",
-            "end_time",
-            "timezone",
-            "activity_place_type",
-            "confidence",
-            "source",
-            "detail",
-        ]
-        output_worksheet = []
-        output_worksheet = (
-            {k: [] for k in header} if not output_worksheet else output_worksheet
+def row_header(store, fmt):
+    header = TIMELINE_HEADER if fmt == "timeline" else LOCATION_HEADER
+    if store.region is not None:
+        return header + ["region"]
+    return header
+
+
+def with_regions(columns, store, start, stop):
+    """Adds the region labels from a --regions search as the last column"""
+    regions = store.regions(start, stop)
+    if regions is not None:
+        columns.append(regions)
+    return columns
+
+
+def find_inputs(path):
+    """Returns the JSON files named by -i: the file itself, every .json file under a
+    directory, or the files matching a glob pattern"""
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.lower().endswith(".json")
         )
-        output_file = f"{filename}.xlsx"
-        for trip in parsed_data:
-            output_worksheet["start_epoch"].append(trip[0])
-            output_worksheet["start_time"].append(trip[1])
-            output_worksheet["start_lat"].append(trip[2])
-            output_worksheet["start_long"].append(trip[3])
-            output_worksheet["waypoints"].append(trip[4])
-            output_worksheet["end_lat"].append(trip[5])
-            output_worksheet["end_long"].append(trip[6])
-            output_worksheet["end_epoch"].append(trip[7])
-            output_worksheet["end_time"].append(trip[8])
-            output_worksheet["timezone"].append(trip[9])
-            output_worksheet["activity_place_type"].append(trip[10])
-            output_worksheet["confidence"].append(trip[11])
-            output_worksheet["source"].append(trip[12])
-            output_worksheet["detail"].append(trip[13])
-        with pd.ExcelWriter(path=output_file, engine="xlsxwriter", mode="w") as writer:
-            try:
-                chunked_data = chunk_list(output_worksheet, "Locations")
-                for chunk_dict, sheet_name in chunked_data:
-                    location_chunk = pd.DataFrame(data=chunk_dict)
-                    if not location_chunk.empty:
-                        location_chunk.to_excel(
-                            excel_writer=writer, sheet_name=sheet_name, index=False
-                        )
-                        worksheet = writer.sheets[sheet_name]
-                        (max_row, max_col) = location_chunk.shape
-                        worksheet.set_column(0, 1, 50)
-                        worksheet.set_column(2, max_col - 1, 30)
-                        worksheet.autofilter(0, 0, max_row, max_col - 1)
-            except Exception as err:
-                print(f"[!] Unable to write Excel: {err}")
-                sys.exit(1)
-    elif fmt == "locations":
-        header = [
-            "timestamp",
-            "timezone",
-            "latitude",
-            "longitude",
-            "accuracy",
-            "source",
-            "deviceTag",
-            "deviceDesignation",
-            "activity_timestamp",
-            "motions",
+    return sorted(
+        match for match in glob.glob(path, recursive=True) if os.path.isfile(match)
+    )
+
+
+def output_name(path, inputs):
+    """Names merged output {directory}/{name}_merged inside the input directory, or the
+    deepest directory holding every file matched by a glob pattern"""
+    if os.path.isfile(path):
+        return path
+    if os.path.isdir(path):
+        directory = os.path.abspath(path)
+    else:
+        directory = os.path.commonpath(
+            [os.path.dirname(os.path.abspath(name)) for name in inputs]
+        )
+    return os.path.join(directory, f"{os.path.basename(directory)}_merged")
+
+
+def load_file(
+    filename,
+    tz="UTC",
+    stream=False,
+    cache_size=None,
+    skip_unknown=False,
+    memory_budget=None,
+    spill_dir=None,
+    stats=None,
+    show_progress=False,
+    json_backend=None,
+):
+    """Ingests and parses one export into an unfiltered store, through the parse cache unless
+    cache_size is None. Returns (store, fmt), or None for a file without any records when
+    skip_unknown is set. memory_budget and spill_dir are passed on to get_locations, and
+    json_backend to ingest."""
+    if cache_size is not None:
+        with stage(stats, "cache_read"):
+            key = cache_key(filename)
+            cached = load_cache(key, tz)
+        if cached:
+            print(f"[-] Using cached records for {filename}")
+            return cached
+    print(f"[-] Ingesting {filename}")
+    with stage(stats, "ingest"):
+        if stream:
+            json_content = stream_ingest(filename)
+        else:
+            json_content = ingest(filename, json_backend)
+    if skip_unknown and not any(key in json_content for key in RECORD_KEYS):
+        print(f"[-] Skipping {filename}, no 'timelineObjects' or 'locations' found")
+        return None
+    print("[-] Parsing json content")
+    records = next(iter(json_content.values()), None)
+    total = len(records) if isinstance(records, list) else None
+    with stage(stats, "parse"), progress(show_progress, "Parsing", total) as line:
+        parsed_data, fmt = parse_json(
+            json_content,
+            tz,
+            memory_budget=memory_budget,
+            spill_dir=spill_dir,
+            stats=stats,
+            progress_line=line,
+        )
+    if cache_size is not None:
+        with stage(stats, "cache_write"):
+            save_cache(key, parsed_data, fmt, cache_size << 20)
+    return parsed_data, fmt
+
+
+def load_file_timed(filename, *args, **kwargs):
+    """load_file for a worker process: returns its result and the stage entries it timed"""
+    stats = Stats()
+    return load_file(filename, *args, stats=stats, **kwargs), list(stats.stages.values())
+
+
+def load_files(
+    filenames,
+    tz="UTC",
+    stream=False,
+    cache_size=None,
+    jobs=1,
+    memory_budget=None,
+    spill_dir=None,
+    stats=None,
+    json_backend=None,
+):
+    """Parses several exports, in a pool of `jobs` processes, and merges them into a single
+    store in time order"""
+    if jobs > 1 and len(filenames) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        load = partial(load_file_timed, json_backend=json_backend)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(filenames))) as executor:
+            timed = list(
+                executor.map(
+                    load,
+                    filenames,
+                    repeat(tz),
+                    repeat(stream),
+                    repeat(cache_size),
+                    repeat(True),
+                    repeat(memory_budget),
+                    repeat(spill_dir),
+                )
+            )
+        results = [result for result, _ in timed]
+        if stats:
+            for _, stages in timed:
+                stats.merge(stages)
+    else:
+        results = [
+            load_file(
+                filename,
+                tz,
+                stream,
+                cache_size,
+                True,
+                memory_budget,
+                spill_dir,
+                stats,
+                json_backend=json_backend,
+            )
+            for filename in filenames
         ]
-        output_worksheet = []
-        output_worksheet = (
-            {k: [] for k in header} if not output_worksheet else output_worksheet
+    results = [result for result in results if result]
+    if not results:
+        raise ValueError(
+            "Unable to find 'timelineObjects' or 'locations' in any of the JSON files."
         )
-        output_file = f"{filename}.xlsx"
-        for trip in parsed_data:
-            output_worksheet["timestamp"].append(trip[0])
-            output_worksheet["timezone"].append(trip[1])
-            output_worksheet["latitude"].append(trip[2])
-            output_worksheet["longitude"].append(trip[3])
-            output_worksheet["accuracy"].append(trip[4])
-            output_worksheet["source"].append(trip[5])
-            output_worksheet["deviceTag"].append(trip[6])
-            output_worksheet["deviceDesignation"].append(trip[7])
-            if trip[8] != "None":
-                output_worksheet["activity_timestamp"].append(trip[8][0][0])
-                output_worksheet["motions"].append("|".join(trip[8][0][1]))
-            else:
-                output_worksheet["activity_timestamp"].append("None")
-                output_worksheet["motions"].append("None")
-        with pd.ExcelWriter(path=output_file, engine="xlsxwriter", mode="w") as writer:
-            try:
-                chunked_data = chunk_list(output_worksheet, "locations")
-                for chunk_dict, sheet_name in chunked_data:
-                    location_chunk = pd.DataFrame(data=chunk_dict)
-                    if not location_chunk.empty:
-                        location_chunk.to_excel(
-                            excel_writer=writer, sheet_name=sheet_name, index=False
-                        )
-                        worksheet = writer.sheets[sheet_name]
-            except Exception as err:
-                print(f"[!] Unable to write Excel: {err}")
-                sys.exit(1)
-    print(f"[+] Excel file generated - {output_file}")
+    formats = {fmt for _, fmt in results}
+    if len(formats) > 1:
+        raise ValueError(
+            "The JSON files mix location records and timeline objects. Please select one or the other and try again"
+        )
+    fmt = formats.pop()
+    stores = [store for store, _ in results]
+    with stage(stats, "merge"):
+        merged = type(stores[0]).concat(stores, str(tz))
+    with stage(stats, "sort"):
+        merged = merged.sort_by("start_timestamp" if fmt == "timeline" else "timestamp")
+    return merged, fmt
 
 
-def create_search_grid(coord1, coord2):
-    lat1, long1 = coord1
-    lat2, long2 = coord2
+def timeline_rows(store):
+    """Yields the Excel rows for a TimelineStore, formatting one block of rows at a time"""
+    for start in range(0, len(store), EXCEL_BLOCK_ROWS):
+        stop = min(start + EXCEL_BLOCK_ROWS, len(store))
+        waypoints = [
+            str([[f"{lat / E7}", f"{long / E7}"] for lat, long in store.waypoints(idx)])
+            for idx in range(start, stop)
+        ]
+        columns = [
+            store.start_timestamp[start:stop].tolist(),
+            format_datetimes(store.start_timestamp[start:stop], store.tz),
+            (store.start_latitude[start:stop] / E7).tolist(),
+            (store.start_longitude[start:stop] / E7).tolist(),
+            waypoints,
+            (store.end_latitude[start:stop] / E7).tolist(),
+            (store.end_longitude[start:stop] / E7).tolist(),
+            store.end_timestamp[start:stop].tolist(),
+            format_datetimes(store.end_timestamp[start:stop], store.tz),
+            [store.tz] * (stop - start),
+            store.decode("activity_type", start, stop),
+            store.decode("confidence", start, stop),
+            store.decode("source", start, stop),
+            [str(list(detail)) for detail in store.decode("detail", start, stop)],
+        ]
+        yield from zip(*with_regions(columns, store, start, stop))
 
-    return (
-        min(lat1, lat2),
-        max(lat1, lat2),
-        min(long1, long2),
-        max(long1, long2),
-    )
 
+def location_rows(store):
+    """Yields the Excel rows for a LocationStore, formatting one block of rows at a time"""
+    for start in range(0, len(store), EXCEL_BLOCK_ROWS):
+        stop = min(start + EXCEL_BLOCK_ROWS, len(store))
+        columns = [
+            format_isoformat(store.timestamp[start:stop], store.tz),
+            [store.tz] * (stop - start),
+            (store.latitude[start:stop] / E7).tolist(),
+            (store.longitude[start:stop] / E7).tolist(),
+            store.accuracy[start:stop].tolist(),
+            store.decode("source", start, stop),
+            store.decode("device_tag", start, stop),
+            store.decode("device_designation", start, stop),
+            format_isoformat(store.activity_timestamp[start:stop], store.tz, zulu=True),
+            [
+                "|".join(motions) if motions else "None"
+                for motions in store.decode("motions", start, stop)
+            ],
+        ]
+        yield from zip(*with_regions(columns, store, start, stop))
 
-def within_search_grid(lat, long, bounds):
-    min_lat, max_lat, min_long, max_long = bounds
-    return min_lat <= lat <= max_lat and min_long <= long <= max_long
 
+def generate_excel(filename, store, fmt, progress_line=None):
+    """Streams the records into an xlsx workbook in constant_memory mode, rolling over to a
+    new sheet (sheet_1, sheet_2 ...) whenever the Excel row limit is reached"""
+    import xlsxwriter
 
-def chunk_list(sheet_dict, sheet_name):
-    chunks = []
-    if "latitude" in sheet_dict and len(sheet_dict["latitude"]) > 1000000:
-        list_len = len(sheet_dict["latitude"])
-        chunk_size = 1000000
+    header = row_header(store, fmt)
+    if fmt == "timeline":
+        sheet_name = "Locations"
+        rows = timeline_rows(store)
+    elif fmt == "locations":
+        sheet_name = "locations"
+        rows = location_rows(store)
+    if progress_line:
+        rows = progress_line.wrap(rows)
+    output_file = f"{filename}.xlsx"
+    sheet_rows = EXCEL_MAX_ROWS - 1
+    sheet_count = max(1, -(-len(store) // sheet_rows))
+    max_col = len(header)
+    try:
+        workbook = xlsxwriter.Workbook(
+            output_file,
+            {
+                "constant_memory": True,
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+            },
+        )
+        header_format = workbook.add_format(
+            {"bold": True, "border": 1, "align": "center", "valign": "top"}
+        )
+        worksheet = None
+        row = 0
+        for number in range(sheet_count):
+            name = sheet_name if sheet_count == 1 else f"{sheet_name}_{number + 1}"
+            worksheet = workbook.add_worksheet(name)
+            worksheet.write_row(0, 0, header, header_format)
+            if fmt == "timeline":
+                worksheet.set_column(0, 1, 50)
+                worksheet.set_column(2, max_col - 1, 30)
+            for row, values in enumerate(islice(rows, sheet_rows), start=1):
+                worksheet.write_row(row, 0, values)
+            if fmt == "timeline":
+                worksheet.autofilter(0, 0, row, max_col - 1)
+        workbook.close()
+    except Exception as err:
+        raise OSError(f"Unable to write Excel: {err}") from err
+    print(f"[+] Excel file generated - {output_file}")
+    return [output_file]
 
-        for start in range(0, list_len, chunk_size):
-            end = min(start + chunk_size, list_len)
-            chunk_dict = {
-                key: value[start:end] if isinstance(value, list) else value
-                for key, value in sheet_dict.items()
-            }
-            chunks.append((chunk_dict, f"{sheet_name}_{len(chunks) + 1}"))
-    else:
-        chunks.append((sheet_dict, sheet_name))
-    return chunks
+
+def generate_csv(filename, store, fmt, progress_line=None):
+    """Writes the same columns as generate_excel to a CSV file, a row at a time"""
+    header = row_header(store, fmt)
+    if fmt == "timeline":
+        rows = timeline_rows(store)
+    elif fmt == "locations":
+        rows = location_rows(store)
+    if progress_line:
+        rows = progress_line.wrap(rows)
+    output_file = f"{filename}.csv"
+    try:
+        with open(
+            output_file, "w", newline="", encoding="utf-8", buffering=1 << 20
+        ) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+    except Exception as err:
+        raise OSError(f"Unable to write CSV: {err}") from err
+    print(f"[+] CSV file generated - {output_file}")
+    return [output_file]
 
 
 def print_available_timezones():
@@ -642,27 +893,6 @@ def print_available_timezones():
         print(tz)
 
 
-def date_filter(timestamp, date_range, time_range, tz="UTC"):
-    date_scope = False
-    time_scope = False
-    tz_obj = ZoneInfo(str(tz))
-    dt_obj = dt.fromisoformat(timestamp).astimezone(tz_obj)
-    if date_range:
-        start_date, end_date = date_range.split("..")
-        s_date = dt.fromisoformat(start_date).date()
-        e_date = dt.fromisoformat(end_date).date()
-        if s_date <= dt_obj.date() <= e_date:
-            date_scope = True
-    if time_range:
-        start_time, end_time = time_range.split("..")
-        s_time = time.fromisoformat(start_time)
-        e_time = time.fromisoformat(end_time)
-        if s_time <= dt_obj.time() <= e_time:
-            time_scope = True
-
-    return date_scope, time_scope
-
-
 def parse_coord(s):
     try:
         lat_str, long_str = s.split(",")
@@ -685,12 +915,36 @@ def main():
         default=2500,
     )
     arg_parse.add_argument(
-        "-i", "--input", metavar="input_file", help="JSON file", required=True
+        "-i",
+        "--input",
+        metavar="input_file",
+        help="JSON file, or a directory or quoted glob pattern of JSON files to merge",
+        required=True,
+    )
+    arg_parse.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes used to parse input files and write KML batches, default is 1",
+        type=int,
+        default=1,
     )
     arg_parse.add_argument("-k", "--kml", help="Output a KML file", action="store_true")
     arg_parse.add_argument(
         "-l", "--list", help="List available timezones", action="store_true"
     )
+    arg_parse.add_argument(
+        "-s",
+        "--stream",
+        help="Stream the JSON file one record at a time instead of loading it all into memory",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--json-backend",
+        help="JSON decoder used when not streaming, default is the fastest one installed "
+        "(orjson, then simdjson, then the standard library json module)",
+        choices=("auto",) + BACKENDS,
+        default="auto",
+    )
     arg_parse.add_argument(
         "-t",
         "--tz",
@@ -701,6 +955,15 @@ def main():
     arg_parse.add_argument(
         "-x", "--excel", help="Output an Excel file", action="store_true"
     )
+    arg_parse.add_argument("--csv", help="Output a CSV file", action="store_true")
+    arg_parse.add_argument(
+        "--parquet", help="Output a Parquet file (requires pyarrow)", action="store_true"
+    )
+    arg_parse.add_argument(
+        "--arrow",
+        help="Output an Arrow IPC file (requires pyarrow)",
+        action="store_true",
+    )
     arg_parse.add_argument("--date-range", help="YYYY-MM-DD..YYYY-MM-DD")
     arg_parse.add_argument("--time-range", help="HH:MM:SS..HH:MM:SS")
     arg_parse.add_argument(
@@ -713,6 +976,135 @@ def main():
         type=parse_coord,
         help="Bottom-right coordinate of search grid: lat, long",
     )
+    arg_parse.add_argument(
+        "--regions",
+        metavar="regions_file",
+        help="Only keep records inside the boxes, radii or polygons listed in this file, "
+        "one 'name;box;lat,long;lat,long', 'name;radius;lat,long;metres' or "
+        "'name;polygon;lat,long;lat,long;lat,long...' per line, and label each record "
+        "with the regions it falls in",
+    )
+    arg_parse.add_argument(
+        "--simplify",
+        help="Drop trip waypoints that are within this many metres of the simplified "
+        "path (Douglas-Peucker), for timeline exports",
+        type=float,
+        metavar="METRES",
+    )
+    arg_parse.add_argument(
+        "--min-distance",
+        help="Drop location records in the same grid cell of this many metres as the "
+        "record before them from the same device",
+        type=float,
+        metavar="METRES",
+    )
+    arg_parse.add_argument(
+        "--min-interval",
+        help="Keep one location record every this many seconds while a device stays in "
+        "one place (in one --min-distance cell, if given)",
+        type=float,
+        metavar="SECONDS",
+    )
+    arg_parse.add_argument(
+        "--max-accuracy",
+        help="Drop location records with an accuracy radius above this many metres",
+        type=int,
+        metavar="METRES",
+    )
+    arg_parse.add_argument(
+        "--segment",
+        help="Turn location records into stays (place visits) and the trips between "
+        "them (activity segments), and write them like a timeline export",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--stay-radius",
+        help="Distance a device must stay within to be staying in one place with "
+        "--segment, default is 200",
+        type=float,
+        default=STAY_RADIUS_M,
+        metavar="METRES",
+    )
+    arg_parse.add_argument(
+        "--stay-time",
+        help="Time a device must stay within --stay-radius for it to be a stay with "
+        "--segment, default is 1200",
+        type=float,
+        default=STAY_SECONDS,
+        metavar="SECONDS",
+    )
+    arg_parse.add_argument(
+        "--vertices-only",
+        help="Draw trip waypoints only as vertices of the trip line in KML output, "
+        "without a placemark for each",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--shared-styles",
+        help="Declare KML styles once per file and reference them from each placemark",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--super-overlay",
+        help="Write the KML output as a regionated super-overlay instead of batch files: "
+        "a quadtree of tiles of at most --batch records, linked from a root doc.kml, "
+        "that show an overview of their records until zoomed in",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--kmz",
+        help="Compress each KML batch into a KMZ file as it is written",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--kmz-level",
+        help="Compression level for KMZ output, 0 (stored) to 9, default is 6",
+        type=int,
+        choices=range(10),
+        default=6,
+        metavar="LEVEL",
+    )
+    arg_parse.add_argument(
+        "--no-cache",
+        help="Parse the JSON file even if it has been parsed before, and do not cache it",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--cache-size",
+        help=f"Size limit of the parse cache in MB, default is {CACHE_SIZE_MB}",
+        type=int,
+        default=CACHE_SIZE_MB,
+        metavar="MB",
+    )
+    arg_parse.add_argument(
+        "--memory-budget",
+        help="Sort location records on disk once they take up more than this many MB of "
+        "memory. Use with -s / --stream to keep memory use bounded for very large files",
+        type=int,
+        metavar="MB",
+    )
+    arg_parse.add_argument(
+        "--spill-dir",
+        help="Directory for the temporary files of --memory-budget, default is the "
+        "system temporary directory",
+        metavar="DIR",
+    )
+    arg_parse.add_argument(
+        "--simplekml",
+        help="Build the KML output with simplekml instead of writing it directly (slower)",
+        action="store_true",
+    )
+    arg_parse.add_argument(
+        "--stats",
+        help="Write the time taken by each stage, record counts, peak memory and output "
+        "file sizes to this JSON file",
+        metavar="FILE",
+    )
+    arg_parse.add_argument(
+        "--progress",
+        help="Show a progress line with the record rate and time remaining on stderr",
+        action="store_true",
+    )
     if len(sys.argv[1:]) == 0:
         arg_parse.print_help()
         arg_parse.exit()
@@ -720,8 +1112,19 @@ def main():
         print_available_timezones()
         sys.exit(0)
     args = arg_parse.parse_args()
+    try:
+        run(args)
+    except (ValueError, ImportError, OSError) as err:
+        print(f"[!] {err}")
+        sys.exit(1)
+
+
+def run(args):
+    """Runs the command line, raising ValueError, ImportError or OSError for main to
+    report"""
     filename = args.input
-    if not os.path.exists(filename) or not os.path.isfile(filename):
+    inputs = find_inputs(filename)
+    if not inputs:
         print(f"[!] Cannot process {filename}. Please check your path and try again")
         sys.exit(1)
     if args.tz and args.tz not in available_timezones():
@@ -736,25 +1139,109 @@ def main():
         )
     else:
         search_grid = None
-    if args.date_range and args.time_range:
-        if ".." not in args.date_range or ".." not in args.time_range:
-            print(
-                "[!] Make sure your date range is YYYY-MM-DD..YYYY-MM-DD and your time range is HH:MM:SS..HH:MM:SS and surround each range with quotes"
-            )
-            sys.exit(1)
-        print(
-            f"[-] Filtering on dates {args.date_range.split('..')[0]} and {args.date_range.split('..')[1]}"
+    search_filter = SearchFilter(args.tz, args.date_range, args.time_range, search_grid)
+    if args.date_range:
+        print("[-] Filtering on dates {} and {}".format(*args.date_range.split("..")))
+    if args.time_range:
+        print("[-] Filtering on times {} and {}".format(*args.time_range.split("..")))
+    if args.simplify is not None and args.simplify < 0:
+        print("[!] The --simplify tolerance cannot be negative")
+        sys.exit(1)
+    decimation = (args.min_distance, args.min_interval, args.max_accuracy)
+    if any(limit is not None and limit <= 0 for limit in decimation):
+        print("[!] --min-distance, --min-interval and --max-accuracy must be positive")
+        sys.exit(1)
+    if args.stay_radius <= 0 or args.stay_time <= 0:
+        print("[!] --stay-radius and --stay-time must be positive")
+        sys.exit(1)
+    try:
+        json_backend = select_backend(args.json_backend)
+    except ValueError as err:
+        print(f"[!] {err}")
+        sys.exit(1)
+    regions = load_regions(args.regions) if args.regions else None
+    cache_size = None if args.no_cache else args.cache_size
+    memory_budget = args.memory_budget << 20 if args.memory_budget else None
+    stats = None
+    if args.stats:
+        stats = Stats(
+            gtl_version=__version__,
+            input=filename,
+            files=len(inputs),
+            json_backend="json" if args.stream else json_backend,
         )
-        print(
-            f"[-] Filtering on times {args.time_range.split('..')[0]} and {args.time_range.split('..')[1]}"
+    if os.path.isfile(filename):
+        parsed_data, fmt = load_file(
+            filename,
+            args.tz,
+            args.stream,
+            cache_size,
+            memory_budget=memory_budget,
+            spill_dir=args.spill_dir,
+            stats=stats,
+            show_progress=args.progress,
+            json_backend=json_backend,
         )
-    print(f"[-] Ingesting {filename}")
-    json_content = ingest(filename)
-    print("[-] Parsing json content")
-
-    parsed_data, fmt = parse_json(
-        json_content, args.tz, args.date_range, args.time_range, search_grid
-    )
+    else:
+        print(f"[-] Merging {len(inputs)} JSON files from {filename}")
+        with stage(stats, "load"):
+            parsed_data, fmt = load_files(
+                inputs,
+                args.tz,
+                args.stream,
+                cache_size,
+                args.jobs,
+                memory_budget,
+                args.spill_dir,
+                stats,
+                json_backend,
+            )
+        filename = output_name(filename, inputs)
+    read = len(parsed_data)
+    with stage(stats, "filter"):
+        parsed_data = search_filter.apply(parsed_data)
+    if regions:
+        print(f"[-] Searching {len(regions)} regions")
+        with stage(stats, "regions"):
+            parsed_data = search_regions(parsed_data, regions)
+        print(f"[-] Found {len(parsed_data)} records inside the regions")
+    searched = len(parsed_data)
+    inaccurate = repeated = 0
+    if any(limit is not None for limit in decimation) and fmt == "locations":
+        with stage(stats, "decimate"):
+            parsed_data, inaccurate, repeated = decimate(parsed_data, *decimation)
+        print(f"[-] Dropped {inaccurate} inaccurate and {repeated} repeated records")
+    elif any(limit is not None for limit in decimation):
+        print("[!] Decimation only applies to location exports, ignoring it")
+    stays = trips = 0
+    if args.segment and fmt == "locations":
+        with stage(stats, "segment"):
+            parsed_data, segmenter = segment_locations(
+                parsed_data, args.stay_radius, args.stay_time
+            )
+        fmt = "timeline"
+        stays, trips = segmenter.stays, segmenter.trips
+        print(f"[-] Segmented records into {stays} stays and {trips} trips")
+    elif args.segment:
+        print("[!] --segment only applies to location exports, ignoring it")
+    dropped = 0
+    if args.simplify is not None and fmt == "timeline":
+        with stage(stats, "simplify"):
+            parsed_data, dropped = simplify_paths(parsed_data, args.simplify)
+        print(f"[-] Simplified trip paths, dropped {dropped} waypoints")
+    elif args.simplify is not None:
+        print("[!] --simplify only applies to timeline exports, ignoring it")
+    if stats:
+        stats.details.update(format=fmt, timezone=str(args.tz))
+        stats.count("read", read)
+        stats.count("filtered_out", read - searched)
+        stats.count("emitted", len(parsed_data))
+        stats.count("waypoints_dropped", dropped)
+        stats.count("inaccurate", inaccurate)
+        stats.count("decimated", repeated)
+        stats.count("stays", stays)
+        stats.count("trips", trips)
+    total = len(parsed_data)
     if args.date_range and args.time_range:
         filename = f"{filename}-{args.date_range}"
     if args.kml:
@@ -762,7 +1249,42 @@ def main():
             "[-] Generating KML file. This can take a long time for large datasets. Please be patient."
         )
         print(f"[-] Started KML generation at {dt.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        generate_kml(filename, parsed_data, fmt, args.batch)
+        if args.super_overlay:
+            with stage(stats, "write_super_overlay") as timed, progress(
+                args.progress, "KML", total
+            ) as line:
+                paths = write_super_overlay(
+                    filename,
+                    parsed_data,
+                    fmt,
+                    args.batch,
+                    args.shared_styles,
+                    args.kmz_level if args.kmz else None,
+                    line,
+                    not args.vertices_only,
+                )
+        elif args.simplekml:
+            with stage(stats, "generate_kml") as timed:
+                paths = generate_kml(
+                    filename, parsed_data, fmt, args.batch, not args.vertices_only
+                )
+        else:
+            with stage(stats, "write_kml") as timed, progress(
+                args.progress, "KML", total
+            ) as line:
+                paths = write_kml(
+                    filename,
+                    parsed_data,
+                    fmt,
+                    args.batch,
+                    args.shared_styles,
+                    args.jobs,
+                    args.kmz_level if args.kmz else None,
+                    line,
+                    not args.vertices_only,
+                )
+        if timed:
+            timed.add_outputs(paths)
         print(
             f"[+] Finished KML generation at {dt.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
@@ -771,8 +1293,27 @@ def main():
             "[-] Generating Excel file. This can take a long time for large datasets. Please be patient."
         )
         print(f"[-] Started Excel generation at {dt.now()}")
-        generate_excel(filename, parsed_data, fmt)
+        with stage(stats, "generate_excel") as timed, progress(
+            args.progress, "Excel", total
+        ) as line:
+            paths = generate_excel(filename, parsed_data, fmt, line)
+        if timed:
+            timed.add_outputs(paths)
         print(f"[+] Finished Excel generation at {dt.now()}")
+    writers = (
+        (args.csv, "generate_csv", "CSV", partial(generate_csv, fmt=fmt)),
+        (args.parquet, "write_parquet", "Parquet", write_parquet),
+        (args.arrow, "write_arrow", "Arrow", write_arrow),
+    )
+    for wanted, name, label, writer in writers:
+        if not wanted:
+            continue
+        with stage(stats, name) as timed, progress(args.progress, label, total) as line:
+            paths = writer(filename, parsed_data, progress_line=line)
+        if timed:
+            timed.add_outputs(paths)
+    if stats:
+        stats.write(args.stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+"""
+JSON decoders for ingest.
+
+Decoding a whole export is done with the fastest decoder installed: orjson, then a simdjson
+binding (pysimdjson), then the standard library json module. For a valid export they all return
+the same dicts, lists, strings and numbers in the same order. The standard library also accepts
+a few things the others reject or read differently: NaN and Infinity, out of range floats, lone
+surrogate escapes and integers wider than 64 bits. A document the fast decoder rejects, or that
+has a run of 20 or more digits, is therefore decoded again with the standard library, so that
+the records and any error are the same whichever backend is used. --stream always uses the
+standard library, the only one with an incremental decoder.
+"""
+
+import json
+from importlib.util import find_spec
+
+BACKENDS = ("orjson", "simdjson", "json")
+SCAN_CHUNK_SIZE = 1 << 24
+WIDE_NUMBER = b"1" * 20
+DIGITS = bytes(49 if 48 <= byte <= 57 else 48 for byte in range(256))
+
+
+def available_backends():
+    """Returns the installed backends, fastest first, without importing them"""
+    return [name for name in BACKENDS if name == "json" or find_spec(name) is not None]
+
+
+def select_backend(name=None):
+    """Returns the named backend, or the fastest installed one for None or "auto". Raises
+    ValueError for a backend that is not installed."""
+    installed = available_backends()
+    if name in (None, "auto"):
+        return installed[0]
+    if name not in installed:
+        raise ValueError(f"The {name} JSON backend is not installed")
+    return name
+
+
+def decoder(name):
+    if name == "orjson":
+        import orjson
+
+        return orjson.loads
+    if name == "simdjson":
+        import simdjson
+
+        return simdjson.loads
+    return json.loads
+
+
+def has_wide_numbers(data):
+    """Whether data has a run of 20 or more digits, which may be an integer too wide for the
+    fast decoders. Scanned a chunk at a time to keep the copy small."""
+    overlap = len(WIDE_NUMBER) - 1
+    for start in range(0, len(data), SCAN_CHUNK_SIZE):
+        chunk = data[start : start + SCAN_CHUNK_SIZE + overlap]
+        if WIDE_NUMBER in chunk.translate(DIGITS):
+            return True
+    return False
+
+
+def load_json(json_file, backend=None):
+    """Decodes a JSON file with the named backend, or the fastest installed one"""
+    name = select_backend(backend)
+    if name != "json":
+        with open(json_file, "rb") as json_data:
+            data = json_data.read()
+        if not has_wide_numbers(data):
+            try:
+                return decoder(name)(data)
+            except ValueError:
+                pass
+        del data
+    with open(json_file, "r", encoding="utf-8") as json_data:
+        return json.load(json_data)
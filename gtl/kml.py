@@ -0,0 +1,461 @@
+"""
+Streaming KML output.
+
+Placemarks are formatted straight into a buffered file handle as each record is read from the
+store, so no KML object tree is built and each batch is only held as the text being written.
+The document layout matches what generate_kml produces through simplekml.
+"""
+
+import io
+from collections import deque
+from contextlib import contextmanager
+from html import escape as escape_html
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from .store import E7
+from .timeutil import format_datetimes, format_isoformat
+
+WRITE_BUFFER = 1 << 20
+NORMAL_ICON = "https://www.gstatic.com/mapspro/images/stock/503-wht-blank_maps.png"
+HIGHLIGHT_ICON = "https://www.gstatic.com/mapspro/images/stock/503-wht-blank_maps.png"
+START_ICON = "http://maps.google.com/mapfiles/kml/paddle/A.png"
+END_ICON = "http://maps.google.com/mapfiles/kml/paddle/B.png"
+LOCATION_ICON = "http://maps.google.com/mapfiles/kml/paddle/blu-blank.png"
+
+KML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+    "<Document>\n"
+)
+KML_FOOTER = "</Document>\n</kml>\n"
+LINE_STYLE = (
+    '<Style id="{style_id}"><IconStyle><color>ff3644db</color><scale>1</scale>'
+    "<Icon><href>{icon}</href></Icon>"
+    '<hotSpot x="32" y="64" xunits="pixels" yunits="insetPixels"/></IconStyle>'
+    "<LabelStyle><scale>{label_scale}</scale></LabelStyle>"
+    "<LineStyle><color>{line_color}</color><width>{line_width}</width></LineStyle>"
+    "{balloon}</Style>\n"
+)
+BALLOON_STYLE = (
+    "<BalloonStyle><bgColor>ffffffff</bgColor><textColor>ff000000</textColor>"
+    "<text><![CDATA[{text}]]></text></BalloonStyle>"
+)
+STYLE_MAP = (
+    '<StyleMap id="{style_id}">'
+    "<Pair><key>normal</key><styleUrl>#{style_id}n</styleUrl></Pair>"
+    "<Pair><key>highlight</key><styleUrl>#{style_id}h</styleUrl></Pair></StyleMap>\n"
+)
+LINE_PLACEMARK = (
+    "<Placemark><name>{name}</name><description>{description}</description>"
+    "<styleUrl>#{style_id}</styleUrl>{extended_data}<LineString><tessellate>1</tessellate>"
+    "<coordinates>{coordinates}</coordinates></LineString></Placemark>\n"
+)
+STYLED_PLACEMARK = (
+    "<Placemark><name>{name}</name><styleUrl>#{style_id}</styleUrl>"
+    "<Point><coordinates>{coordinates}</coordinates></Point></Placemark>\n"
+)
+ICON_STYLE = '<Style id="{style_id}"><IconStyle><Icon><href>{icon}</href></Icon></IconStyle></Style>\n'
+DATA = '<Data name="{name}"><value>{value}</value></Data>'
+ICON_PLACEMARK = (
+    "<Placemark><name>{name}</name>"
+    "<Style><IconStyle><Icon><href>{icon}</href></Icon></IconStyle></Style>"
+    "<Point><coordinates>{coordinates}</coordinates></Point></Placemark>\n"
+)
+POINT_PLACEMARK = (
+    "<Placemark><name>{name}</name>"
+    "<Point><coordinates>{coordinates}</coordinates></Point></Placemark>\n"
+)
+TRIP_BALLOON = """
+        <div style="width: 300px;">
+            <h2>Trip {i}</h2>
+            <p>Starts at {start_time}</p>
+            <p>Ends at {end_time}</p>
+            <p>Details:</p>
+            <p>{detail}</p>
+            <p>Activity / Place: {activity_type}</p>
+            <p>Confidence: {confidence}</p>
+        </div>
+"""
+LOCATION_BALLOON = """
+        <div style="width: 300px;">
+            <h2>Location {i}</h2>
+            <p>Location Timestamp {location_timestamp}</p>
+            <p>Details:</p>
+            <p>Type / Confidence - {motion_details}</p>
+        </div>
+"""
+# With shared styles the balloon is declared once, and each placemark fills it in from its
+# ExtendedData through KML entity replacement
+TRIP_FIELDS = ("i", "start_time", "end_time", "detail", "activity_type", "confidence")
+LOCATION_FIELDS = ("i", "location_timestamp", "motion_details")
+SHARED_TRIP_BALLOON = TRIP_BALLOON.format(**{name: f"$[{name}]" for name in TRIP_FIELDS})
+SHARED_LOCATION_BALLOON = LOCATION_BALLOON.format(
+    **{name: f"$[{name}]" for name in LOCATION_FIELDS}
+)
+
+
+def escape(text):
+    """Escapes &, < and > for XML text, as xml.sax.saxutils.escape does (which would pull in
+    urllib at startup)"""
+    return escape_html(text, quote=False)
+
+
+def line_styles(style_id, balloon_text):
+    normal = LINE_STYLE.format(
+        style_id=f"{style_id}n",
+        icon=NORMAL_ICON,
+        label_scale=0,
+        line_color="ffff6712",
+        line_width=5,
+        balloon="",
+    )
+    highlight = LINE_STYLE.format(
+        style_id=f"{style_id}h",
+        icon=HIGHLIGHT_ICON,
+        label_scale=1,
+        line_color="ff0000ff",
+        line_width=7.5,
+        balloon=BALLOON_STYLE.format(text=balloon_text),
+    )
+    return normal + highlight + STYLE_MAP.format(style_id=style_id)
+
+
+def shared_styles(fmt):
+    """Returns the style declarations referenced by every placemark in shared style mode"""
+    if fmt == "timeline":
+        return (
+            line_styles("trip", SHARED_TRIP_BALLOON)
+            + ICON_STYLE.format(style_id="start", icon=START_ICON)
+            + ICON_STYLE.format(style_id="end", icon=END_ICON)
+        )
+    return line_styles("location", SHARED_LOCATION_BALLOON) + ICON_STYLE.format(
+        style_id="point", icon=LOCATION_ICON
+    )
+
+
+def extended_data(fields):
+    data = "".join(DATA.format(name=name, value=value) for name, value in fields.items())
+    return f"<ExtendedData>{data}</ExtendedData>"
+
+
+def region_suffixes(store, start, stop):
+    """Returns the ' - Region ...' folder name suffix for each record of a --regions search"""
+    regions = store.regions(start, stop)
+    if regions is None:
+        return [""] * (stop - start)
+    return [f" - Region {escape(region)}" for region in regions]
+
+
+def batch_ranges(store, fmt, start, stop):
+    """Returns the first and last dates of a batch, as used in the KML file names"""
+    if fmt == "timeline":
+        first = format_datetimes(store.start_timestamp[start : start + 1], store.tz)
+        last = format_datetimes(store.end_timestamp[stop - 1 : stop], store.tz)
+    else:
+        first = format_datetimes(store.timestamp[start : start + 1], store.tz)
+        last = format_datetimes(store.timestamp[stop - 1 : stop], store.tz)
+    return first[0][:10], last[0][:10]
+
+
+def kml_batches(filename, store, fmt, batch, extension="kml"):
+    """Yields (path, start, stop) for each batch of features. Full batches are numbered with
+    their date range, and a trailing partial batch is written as the _final file."""
+    for number, start in enumerate(range(0, len(store), batch), start=1):
+        stop = min(start + batch, len(store))
+        range_start, range_end = batch_ranges(store, fmt, start, stop)
+        if stop - start == batch:
+            path = f"{filename}_{range_start}_{range_end}_{number}.{extension}"
+        else:
+            path = f"{filename}_{range_start}_final.{extension}"
+        yield path, start, stop
+
+
+@contextmanager
+def kml_output(path, kmz_level=None):
+    """Opens a batch file for writing. When kmz_level is set the document is compressed
+    into the doc.kml entry of a KMZ archive as it is written, at that zlib level (0 stores
+    it uncompressed), so no intermediate .kml is written to disk."""
+    if kmz_level is None:
+        with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as output:
+            yield output
+        return
+    compression = ZIP_STORED if kmz_level == 0 else ZIP_DEFLATED
+    with ZipFile(
+        path, "w", compression=compression, compresslevel=kmz_level or None
+    ) as archive:
+        with archive.open("doc.kml", "w", force_zip64=True) as entry:
+            with io.TextIOWrapper(entry, encoding="utf-8") as output:
+                yield output
+
+
+def write_timeline_features(
+    output, store, start, stop, shared=False, first=None, waypoint_points=True
+):
+    """Writes a folder per trip: its line, start and end icons and, unless waypoint_points
+    is off, a point for each waypoint"""
+    start_times = format_datetimes(store.start_timestamp[start:stop], store.tz)
+    end_times = format_datetimes(store.end_timestamp[start:stop], store.tz)
+    start_lats = (store.start_latitude[start:stop] / E7).tolist()
+    start_longs = (store.start_longitude[start:stop] / E7).tolist()
+    end_lats = (store.end_latitude[start:stop] / E7).tolist()
+    end_longs = (store.end_longitude[start:stop] / E7).tolist()
+    activity_types = store.decode("activity_type", start, stop)
+    confidences = store.decode("confidence", start, stop)
+    sources = store.decode("source", start, stop)
+    details = store.decode("detail", start, stop)
+    regions = region_suffixes(store, start, stop)
+    offsets = store.waypoint_offsets[start : stop + 1]
+    offsets = (offsets - offsets[0]).tolist()
+    points = slice(store.waypoint_offsets[start], store.waypoint_offsets[stop])
+    waypoint_lats = (store.waypoint_latitude[points] / E7).tolist()
+    waypoint_longs = (store.waypoint_longitude[points] / E7).tolist()
+    first = start + 1 if first is None else first
+    for offset in range(stop - start):
+        i = first + offset
+        start_time = start_times[offset]
+        end_time = end_times[offset]
+        activity_type = escape(activity_types[offset])
+        confidence = escape(confidences[offset])
+        detail = escape(" ".join(details[offset]))
+        trip_coords = [(start_longs[offset], start_lats[offset])]
+        trip_coords.extend(
+            zip(
+                waypoint_longs[offsets[offset] : offsets[offset + 1]],
+                waypoint_lats[offsets[offset] : offsets[offset + 1]],
+            )
+        )
+        trip_coords.append((end_longs[offset], end_lats[offset]))
+        fields = {
+            "i": i,
+            "start_time": start_time,
+            "end_time": end_time,
+            "detail": detail,
+            "activity_type": activity_type,
+            "confidence": confidence,
+        }
+        start_name = f"Start - {start_time} - {activity_type} - Confidence {confidence} - Source {escape(sources[offset])}"
+        start_coordinates = f"{trip_coords[0][0]},{trip_coords[0][1]},0.0"
+        parts = [
+            f"<Folder><name>Trip {i} - {start_time} - {end_time} - {activity_type} - {detail}{regions[offset]}</name>\n"
+        ]
+        if shared:
+            style_id = "trip"
+            data = extended_data(fields)
+        else:
+            style_id = f"trip{i}"
+            data = ""
+            parts.append(line_styles(style_id, TRIP_BALLOON.format(**fields)))
+        parts.append(
+            LINE_PLACEMARK.format(
+                name=f"Trip {i}",
+                description="".join(f"{long},{lat}\n" for long, lat in trip_coords),
+                style_id=style_id,
+                extended_data=data,
+                coordinates=" ".join(f"{long},{lat},0.0" for long, lat in trip_coords),
+            )
+        )
+        if shared:
+            parts.append(
+                STYLED_PLACEMARK.format(
+                    name=start_name, style_id="start", coordinates=start_coordinates
+                )
+            )
+        else:
+            parts.append(
+                ICON_PLACEMARK.format(
+                    name=start_name, icon=START_ICON, coordinates=start_coordinates
+                )
+            )
+        if waypoint_points:
+            for wpt_num, (long, lat) in enumerate(trip_coords[1:-1], start=1):
+                parts.append(
+                    POINT_PLACEMARK.format(
+                        name=f"Waypoint {wpt_num}", coordinates=f"{long},{lat},0.0"
+                    )
+                )
+        end_coordinates = f"{trip_coords[-1][0]},{trip_coords[-1][1]},0.0"
+        if shared:
+            parts.append(
+                STYLED_PLACEMARK.format(
+                    name=f"End - {end_time}", style_id="end", coordinates=end_coordinates
+                )
+            )
+        else:
+            parts.append(
+                ICON_PLACEMARK.format(
+                    name=f"End - {end_time}", icon=END_ICON, coordinates=end_coordinates
+                )
+            )
+        parts.append("</Folder>\n")
+        output.write("".join(parts))
+
+
+def write_location_features(output, store, start, stop, shared=False, first=None):
+    location_times = format_isoformat(store.timestamp[start:stop], store.tz)
+    activity_times = format_isoformat(
+        store.activity_timestamp[start:stop], store.tz, zulu=True
+    )
+    lats = (store.latitude[start:stop] / E7).tolist()
+    longs = (store.longitude[start:stop] / E7).tolist()
+    accuracies = store.accuracy[start:stop].tolist()
+    motions = store.decode("motions", start, stop)
+    sources = store.decode("source", start, stop)
+    regions = region_suffixes(store, start, stop)
+    first = start + 1 if first is None else first
+    for offset in range(stop - start):
+        i = first + offset
+        location_timestamp = location_times[offset]
+        motion_details = escape(",".join(motions[offset])) or "None"
+        fields = {
+            "i": i,
+            "location_timestamp": location_timestamp,
+            "motion_details": motion_details,
+        }
+        coordinates = f"{longs[offset]},{lats[offset]}"
+        parts = [
+            f"<Folder><name>Location {i} - {location_timestamp}/{activity_times[offset]} - Accuracy {accuracies[offset]} - Type (T) / Confidence (C) {motion_details} - Source {escape(str(sources[offset]))}{regions[offset]}</name>\n"
+        ]
+        if shared:
+            style_id = "location"
+            data = extended_data(fields)
+        else:
+            style_id = f"location{i}"
+            data = ""
+            parts.append(line_styles(style_id, LOCATION_BALLOON.format(**fields)))
+        parts.append(
+            LINE_PLACEMARK.format(
+                name=f"Location {i}",
+                description=f"{coordinates}\n",
+                style_id=style_id,
+                extended_data=data,
+                coordinates=f"{coordinates},0.0",
+            )
+        )
+        if shared:
+            parts.append(
+                STYLED_PLACEMARK.format(
+                    name=f"Location {i} - {location_timestamp}",
+                    style_id="point",
+                    coordinates=f"{coordinates},0.0",
+                )
+            )
+        else:
+            parts.append(
+                ICON_PLACEMARK.format(
+                    name=f"Location {i} - {location_timestamp}",
+                    icon=LOCATION_ICON,
+                    coordinates=f"{coordinates},0.0",
+                )
+            )
+        parts.append("</Folder>\n")
+        output.write("".join(parts))
+
+
+def write_features(
+    output, store, fmt, start, stop, shared=False, first=None, waypoint_points=True
+):
+    """Writes the folders for records start to stop, after the shared styles if shared is
+    set"""
+    if shared:
+        output.write(shared_styles(fmt))
+    if fmt == "timeline":
+        write_timeline_features(
+            output, store, start, stop, shared, first, waypoint_points
+        )
+    elif fmt == "locations":
+        write_location_features(output, store, start, stop, shared, first)
+
+
+def write_kml_document(
+    output, store, fmt, start, stop, shared=False, first=None, waypoint_points=True
+):
+    """Writes records start to stop of the store as one complete KML document, numbering the
+    features from first (start + 1 by default). With shared set, styles are declared once at
+    the top and referenced by each placemark."""
+    output.write(KML_HEADER)
+    write_features(output, store, fmt, start, stop, shared, first, waypoint_points)
+    output.write(KML_FOOTER)
+
+
+def write_kml_file(
+    path,
+    store,
+    fmt,
+    start,
+    stop,
+    shared=False,
+    first=None,
+    kmz_level=None,
+    waypoint_points=True,
+):
+    """Writes one batch file and returns the status line to report for it"""
+    try:
+        with kml_output(path, kmz_level) as output:
+            write_kml_document(
+                output, store, fmt, start, stop, shared, first, waypoint_points
+            )
+        return f"[+] KML file generated - {path}"
+    except Exception as err:
+        return f"[!] Error encountered trying to save KML file - {err}"
+
+
+def write_kml(
+    filename,
+    store,
+    fmt,
+    batch,
+    shared=False,
+    jobs=1,
+    kmz_level=None,
+    progress_line=None,
+    waypoint_points=True,
+):
+    """Streams the records to KML files of `batch` features each, named as generate_kml
+    names them, or to KMZ files when kmz_level is set. With more than one job the batches
+    are written by a process pool; each worker is sent only its own slice of the store, at
+    most two batches per worker are in flight at once, and results are reported in batch
+    order. Returns the paths of the batch files, and advances progress_line by each batch
+    as it is written. Without waypoint_points, trip waypoints are only drawn as vertices of
+    the trip line."""
+    extension = "kml" if kmz_level is None else "kmz"
+    batches = kml_batches(filename, store, fmt, batch, extension)
+    paths = []
+
+    def report(status, path, size):
+        print(status)
+        paths.append(path)
+        if progress_line:
+            progress_line.advance(size)
+
+    if jobs <= 1 or len(store) <= batch:
+        for path, start, stop in batches:
+            status = write_kml_file(
+                path, store, fmt, start, stop, shared, None, kmz_level, waypoint_points
+            )
+            report(status, path, stop - start)
+        return paths
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for path, start, stop in batches:
+            batch_store = store.take(slice(start, stop)).compact()
+            future = executor.submit(
+                write_kml_file,
+                path,
+                batch_store,
+                fmt,
+                0,
+                stop - start,
+                shared,
+                start + 1,
+                kmz_level,
+                waypoint_points,
+            )
+            pending.append((future, path, stop - start))
+            if len(pending) >= jobs * 2:
+                future, path, size = pending.popleft()
+                report(future.result(), path, size)
+        while pending:
+            future, path, size = pending.popleft()
+            report(future.result(), path, size)
+    return paths
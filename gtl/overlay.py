@@ -0,0 +1,253 @@
+"""
+Regionated KML super-overlays.
+
+Every batch file loads all of its features at once, which Google Earth struggles with for a
+large case. A super-overlay instead splits the records into a quadtree of tiles over the area
+they cover. Each tile is a KML document with a Region, linked from its parent tile by a
+NetworkLink, so a viewer only loads the tiles that are in view and large enough on screen. A
+tile with more than `batch` records is split into four. It does not draw its records, only an
+overview of them: one placemark per cell of an 8 x 8 grid, at the centroid of the records in
+the cell, with their count and time span. The overview is hidden once the child tiles take
+over. Leaf tiles draw their records in full as the batch files do, numbered from 1 in each
+tile. Trips are placed by their start point.
+
+The root document is doc.kml. It sits with the tiles in a {filename}_overlay directory, or in a
+{filename}_overlay.kmz archive that holds all of them.
+"""
+
+import io
+import os
+from contextlib import contextmanager
+from typing import NamedTuple
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import numpy as np
+from .kml import (
+    ICON_STYLE,
+    KML_FOOTER,
+    KML_HEADER,
+    LOCATION_ICON,
+    WRITE_BUFFER,
+    write_features,
+)
+from .store import E7
+from .timeutil import format_datetimes
+
+MIN_LOD_PIXELS = 128
+OVERVIEW_CELLS = 8
+MAX_DEPTH = 20
+MIN_SPAN = 1e-5
+ROOT = "doc.kml"
+REGION = (
+    "<Region><LatLonAltBox><north>{north}</north><south>{south}</south>"
+    "<east>{east}</east><west>{west}</west></LatLonAltBox>"
+    "<Lod><minLodPixels>{min_pixels}</minLodPixels>"
+    "<maxLodPixels>{max_pixels}</maxLodPixels></Lod></Region>"
+)
+NETWORK_LINK = (
+    "<NetworkLink><name>{name}</name>{region}<Link><href>{href}</href>"
+    "<viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>\n"
+)
+OVERVIEW_PLACEMARK = (
+    "<Placemark><name>{name}</name><description>{description}</description>"
+    "<styleUrl>#overview</styleUrl>"
+    "<Point><coordinates>{coordinates}</coordinates></Point></Placemark>\n"
+)
+
+
+class Tile(NamedTuple):
+    level: int
+    x: int
+    y: int
+    south: float
+    west: float
+    north: float
+    east: float
+    indices: np.ndarray
+
+    @property
+    def name(self):
+        return ROOT if self.level == 0 else f"{self.level}_{self.x}_{self.y}.kml"
+
+    def region(self, max_pixels=-1):
+        """The root tile is always active; the others once they cover MIN_LOD_PIXELS"""
+        return REGION.format(
+            north=self.north,
+            south=self.south,
+            east=self.east,
+            west=self.west,
+            min_pixels=0 if self.level == 0 else MIN_LOD_PIXELS,
+            max_pixels=max_pixels,
+        )
+
+
+def split(tile, latitude, longitude):
+    """Returns the quarters of a tile that hold any of its records"""
+    middle_latitude = (tile.south + tile.north) / 2
+    middle_longitude = (tile.west + tile.east) / 2
+    north = latitude[tile.indices] >= middle_latitude
+    east = longitude[tile.indices] >= middle_longitude
+    children = []
+    for row in (0, 1):
+        for column in (0, 1):
+            indices = tile.indices[(north == bool(row)) & (east == bool(column))]
+            if not len(indices):
+                continue
+            children.append(
+                Tile(
+                    tile.level + 1,
+                    tile.x * 2 + column,
+                    tile.y * 2 + row,
+                    middle_latitude if row else tile.south,
+                    middle_longitude if column else tile.west,
+                    tile.north if row else middle_latitude,
+                    tile.east if column else middle_longitude,
+                    indices,
+                )
+            )
+    return children
+
+
+def write_overview(output, tile, latitude, longitude, starts, ends, tz, noun):
+    """Writes a placemark for each cell of an OVERVIEW_CELLS square grid over the tile
+    holding any records, named with their count and described by their time span"""
+    lat = latitude[tile.indices]
+    long = longitude[tile.indices]
+    last_cell = OVERVIEW_CELLS - 1
+    rows = (lat - tile.south) * (OVERVIEW_CELLS / (tile.north - tile.south))
+    columns = (long - tile.west) * (OVERVIEW_CELLS / (tile.east - tile.west))
+    cells = np.minimum(rows.astype(np.int64), last_cell) * OVERVIEW_CELLS + np.minimum(
+        columns.astype(np.int64), last_cell
+    )
+    _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    centre_lat = np.bincount(inverse, lat) / counts
+    centre_long = np.bincount(inverse, long) / counts
+    first = np.full(len(counts), np.iinfo(np.int64).max)
+    np.minimum.at(first, inverse, starts[tile.indices])
+    last = np.full(len(counts), np.iinfo(np.int64).min)
+    np.maximum.at(last, inverse, ends[tile.indices])
+    first_times = format_datetimes(first, tz)
+    last_times = format_datetimes(last, tz)
+    parts = [ICON_STYLE.format(style_id="overview", icon=LOCATION_ICON)]
+    parts.append(f"<Folder><name>Overview</name>{tile.region(2 * MIN_LOD_PIXELS)}\n")
+    for count, first_time, last_time, cell_lat, cell_long in zip(
+        counts.tolist(),
+        first_times,
+        last_times,
+        np.round(centre_lat, 7).tolist(),
+        np.round(centre_long, 7).tolist(),
+    ):
+        parts.append(
+            OVERVIEW_PLACEMARK.format(
+                name=f"{count} {noun}{'' if count == 1 else 's'}",
+                description=f"{first_time} - {last_time}",
+                coordinates=f"{cell_long},{cell_lat},0.0",
+            )
+        )
+    parts.append("</Folder>\n")
+    output.write("".join(parts))
+
+
+@contextmanager
+def overlay_output(root, kmz_level=None):
+    """Yields a function that opens a tile for writing by name, as a file in the root
+    directory, or as an entry of the root KMZ archive when kmz_level is set"""
+    if kmz_level is None:
+        os.makedirs(root, exist_ok=True)
+
+        def open_tile(name):
+            return open(
+                os.path.join(root, name), "w", encoding="utf-8", buffering=WRITE_BUFFER
+            )
+
+        yield open_tile
+        return
+    compression = ZIP_STORED if kmz_level == 0 else ZIP_DEFLATED
+    with ZipFile(
+        f"{root}.kmz", "w", compression=compression, compresslevel=kmz_level or None
+    ) as archive:
+
+        @contextmanager
+        def open_tile(name):
+            with archive.open(name, "w", force_zip64=True) as entry:
+                with io.TextIOWrapper(entry, encoding="utf-8") as output:
+                    yield output
+
+        yield open_tile
+
+
+def write_super_overlay(
+    filename,
+    store,
+    fmt,
+    batch,
+    shared=False,
+    kmz_level=None,
+    progress_line=None,
+    waypoint_points=True,
+):
+    """Writes the records as a super-overlay of tiles holding at most `batch` records each, to
+    a directory or, when kmz_level is set, a KMZ archive. Tiles stop being split at MAX_DEPTH,
+    or when their quarters would be under MIN_SPAN degrees across. Tiles are written parent
+    first, so the root is the first entry of the archive. Returns the paths written, and
+    advances progress_line as the records of each leaf are drawn."""
+    if not len(store):
+        return []
+    if fmt == "timeline":
+        latitude = store.start_latitude / E7
+        longitude = store.start_longitude / E7
+        starts, ends = store.start_timestamp, store.end_timestamp
+        noun = "trip"
+    else:
+        latitude = store.latitude / E7
+        longitude = store.longitude / E7
+        starts = ends = store.timestamp
+        noun = "location"
+    south, north = float(latitude.min()), float(latitude.max())
+    west, east = float(longitude.min()), float(longitude.max())
+    north = max(north, south + MIN_SPAN)
+    east = max(east, west + MIN_SPAN)
+    root = f"{filename}_overlay"
+    paths = []
+    tiles = 0
+    pending = [Tile(0, 0, 0, south, west, north, east, np.arange(len(store)))]
+    with overlay_output(root, kmz_level) as open_tile:
+        while pending:
+            tile = pending.pop()
+            children = []
+            span = max(tile.north - tile.south, tile.east - tile.west)
+            if len(tile.indices) > batch and tile.level < MAX_DEPTH:
+                if span >= 2 * MIN_SPAN:
+                    children = split(tile, latitude, longitude)
+            with open_tile(tile.name) as output:
+                output.write(KML_HEADER)
+                output.write(f"{tile.region()}\n")
+                if children:
+                    write_overview(
+                        output, tile, latitude, longitude, starts, ends, store.tz, noun
+                    )
+                    for child in children:
+                        output.write(
+                            NETWORK_LINK.format(
+                                name=child.name[:-4],
+                                region=child.region(),
+                                href=child.name,
+                            )
+                        )
+                else:
+                    leaf = store.take(tile.indices)
+                    write_features(
+                        output, leaf, fmt, 0, len(leaf), shared, None, waypoint_points
+                    )
+                output.write(KML_FOOTER)
+            if kmz_level is None:
+                paths.append(os.path.join(root, tile.name))
+            if progress_line and not children:
+                progress_line.advance(len(tile.indices))
+            pending.extend(reversed(children))
+            tiles += 1
+    if kmz_level is not None:
+        paths.append(f"{root}.kmz")
+    print(
+        f"[+] KML super-overlay generated - {paths[0]} ({tiles} tile{'' if tiles == 1 else 's'})"
+    )
+    return paths
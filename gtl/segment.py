@@ -0,0 +1,150 @@
+"""
+Stay point and trip segmentation of raw location fixes.
+
+Fixes are read once in time order. Each device has an open cluster: the fixes within radius
+metres of the first fix of the cluster. When a fix falls outside it the cluster is closed, and
+becomes a stay point (a place visit at the centroid of its fixes) if it spanned at least dwell
+seconds; otherwise its fixes are part of the path the device is moving along. The path between
+two stays becomes an activity segment from the first stay to the next, with the path fixes as
+its waypoints. Only the open cluster and path of each device are held, so fixes can be fed in
+from a stream, and the result is a TimelineStore that is written like a Semantic Location
+History export: millions of fixes become a few thousand place visits and trips.
+"""
+
+import math
+import numpy as np
+from .spatial import METRES_PER_E7, haversine_m
+from .store import ACTIVITY_SEGMENT, E7, PLACE_VISIT, TimelineBuilder
+
+STAY_RADIUS_M = 200
+STAY_SECONDS = 1200
+
+
+class Track:
+    """The open cluster and the path since the last stay of one device. Fixes are
+    (timestamp, latitude, longitude) with E7 coordinates."""
+
+    __slots__ = ("source", "anchor", "scale", "members", "path", "stay")
+
+    def __init__(self, device):
+        self.source = str({"deviceTag": device})
+        self.anchor = None
+        self.scale = None
+        self.members = []
+        self.path = []
+        self.stay = None
+
+
+class Segmenter:
+    def __init__(self, tz="UTC", radius=STAY_RADIUS_M, dwell=STAY_SECONDS):
+        self.builder = TimelineBuilder(str(tz))
+        self.radius = radius
+        self.radius_squared = radius * radius
+        self.dwell_ms = round(dwell * 1000)
+        self.tracks = {}
+        self.stays = 0
+        self.trips = 0
+
+    def add(self, device, timestamp, latitude, longitude):
+        """Adds the next fix of a device, which must not be older than its last one"""
+        track = self.tracks.get(device)
+        if track is None:
+            track = self.tracks[device] = Track(device)
+        fix = (timestamp, latitude, longitude)
+        if track.members:
+            north = (latitude - track.anchor[1]) * METRES_PER_E7
+            east = (longitude - track.anchor[2]) * track.scale
+            if north * north + east * east <= self.radius_squared:
+                track.members.append(fix)
+                return
+            self.close(track)
+        track.anchor = fix
+        track.scale = math.cos(math.radians(latitude / E7)) * METRES_PER_E7
+        track.members = [fix]
+
+    def close(self, track):
+        members = track.members
+        track.members = []
+        if members[-1][0] - members[0][0] < self.dwell_ms:
+            track.path.extend(members)
+            return
+        latitude = round(sum(fix[1] for fix in members) / len(members))
+        longitude = round(sum(fix[2] for fix in members) / len(members))
+        self.move(track, (members[0][0], latitude, longitude))
+        self.builder.append(
+            PLACE_VISIT,
+            members[0][0],
+            members[-1][0],
+            latitude,
+            longitude,
+            latitude,
+            longitude,
+            (),
+            "STAY_POINT",
+            "INFERRED",
+            track.source,
+            (f"Stay of {len(members)} fixes within {self.radius} m",),
+        )
+        self.stays += 1
+        track.stay = (members[-1][0], latitude, longitude)
+
+    def move(self, track, end=None):
+        """Records the path from the last stay, or the first fix moved through, to end, or
+        to the last fix moved through"""
+        path = track.path
+        track.path = []
+        start = track.stay
+        if start is None:
+            if not path:
+                return
+            start, path = path[0], path[1:]
+        if end is None:
+            if not path:
+                return
+            path, end = path[:-1], path[-1]
+        points = np.array([start] + path + [end], dtype=np.int64)
+        distance = haversine_m(
+            points[:-1, 1] / E7,
+            points[:-1, 2] / E7,
+            points[1:, 1] / E7,
+            points[1:, 2] / E7,
+        ).sum()
+        self.builder.append(
+            ACTIVITY_SEGMENT,
+            start[0],
+            end[0],
+            start[1],
+            start[2],
+            end[1],
+            end[2],
+            [(latitude, longitude) for _, latitude, longitude in path],
+            "MOVING",
+            "INFERRED",
+            track.source,
+            (f"Distance: {round(distance)}", f"Fixes: {len(path)}"),
+        )
+        self.trips += 1
+
+    def build(self):
+        """Closes every device's open cluster and path and returns the place visits and
+        activity segments in time order"""
+        for track in self.tracks.values():
+            if track.members:
+                self.close(track)
+            self.move(track)
+        return self.builder.build().sort_by("start_timestamp")
+
+
+def segment_locations(store, radius=STAY_RADIUS_M, dwell=STAY_SECONDS):
+    """Segments a time ordered LocationStore into a TimelineStore of stays and trips.
+    Returns the store and the Segmenter, which holds the number of each."""
+    segmenter = Segmenter(store.tz, radius, dwell)
+    add = segmenter.add
+    for fix in zip(
+        store.decode("device_tag"),
+        store.timestamp.tolist(),
+        store.latitude.tolist(),
+        store.longitude.tolist(),
+    ):
+        add(*fix)
+    return segmenter.build(), segmenter
@@ -0,0 +1,90 @@
+"""
+Douglas-Peucker simplification of timeline trip paths.
+
+A trip is drawn through its start point, its waypoints and its end point. simplify_paths drops
+the waypoints that lie within a tolerance in metres of the line kept through their neighbours,
+so long trips keep their shape with far fewer vertices and placemarks. The start and end points
+are never dropped. Each trip is projected onto a flat plane in metres from its start point,
+which is accurate to well under a metre over the distances a single trip covers.
+
+The first step of the algorithm, measuring every waypoint against the straight line from its
+trip's start to its end, is done for all trips at once; only the trips which stray further
+than the tolerance from that line are then split recursively one at a time.
+"""
+
+import numpy as np
+from .store import E7, TimelineStore
+from .spatial import METRES_PER_E7
+
+
+def segment_distances(x, y, dx, dy):
+    """Returns the distances of the points x, y from the segments running from the origin to
+    dx, dy. Measuring to the segment rather than the whole line keeps paths which double back
+    past either end, or return to where they started, from being flattened."""
+    length = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        along = np.where(length > 0, np.clip((x * dx + y * dy) / length, 0, 1), 0)
+    return np.hypot(x - along * dx, y - along * dy)
+
+
+def douglas_peucker(x, y, tolerance):
+    """Returns a mask of the points of the line x, y to keep so that no dropped point is
+    further than tolerance from the simplified line. The end points are always kept."""
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    pending = [(0, len(x) - 1)]
+    while pending:
+        first, last = pending.pop()
+        if last - first < 2:
+            continue
+        distances = segment_distances(
+            x[first + 1 : last] - x[first],
+            y[first + 1 : last] - y[first],
+            x[last] - x[first],
+            y[last] - y[first],
+        )
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            pending.append((first, split))
+            pending.append((split, last))
+    return keep
+
+
+def simplify_paths(store, tolerance):
+    """Returns the TimelineStore with the waypoints of each record simplified to within
+    tolerance metres, and the number of waypoints dropped"""
+    offsets = store.waypoint_offsets
+    counts = np.diff(offsets)
+    trips = np.repeat(np.arange(len(store)), counts)
+    # Metres east and north of each trip's start point
+    mid_latitude = (store.start_latitude / 2 + store.end_latitude / 2) / E7
+    east = np.cos(np.radians(mid_latitude)) * METRES_PER_E7
+    start_longitude = store.start_longitude.astype(np.int64)
+    start_latitude = store.start_latitude.astype(np.int64)
+    x = (store.waypoint_longitude - start_longitude[trips]) * east[trips]
+    y = (store.waypoint_latitude - start_latitude[trips]) * METRES_PER_E7
+    end_x = (store.end_longitude - start_longitude) * east
+    end_y = (store.end_latitude - start_latitude) * METRES_PER_E7
+    distances = segment_distances(x, y, end_x[trips], end_y[trips])
+    keep = np.zeros(len(x), dtype=bool)
+    with_points = np.flatnonzero(counts)
+    if len(with_points):
+        farthest = np.maximum.reduceat(distances, offsets[with_points])
+        for index in with_points[farthest > tolerance].tolist():
+            first, last = int(offsets[index]), int(offsets[index + 1])
+            path_x = np.concatenate(([0.0], x[first:last], end_x[index : index + 1]))
+            path_y = np.concatenate(([0.0], y[first:last], end_y[index : index + 1]))
+            keep[first:last] = douglas_peucker(path_x, path_y, tolerance)[1:-1]
+    dropped = int(len(keep) - np.count_nonzero(keep))
+    if not dropped:
+        return store, 0
+    kept_before = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(keep, out=kept_before[1:])
+    columns = store.columns
+    columns["waypoint_offsets"] = kept_before[offsets]
+    columns["waypoint_latitude"] = store.waypoint_latitude[keep]
+    columns["waypoint_longitude"] = store.waypoint_longitude[keep]
+    simplified = TimelineStore(columns, store.tables, store.tz)
+    return store.copy_regions(simplified), dropped
@@ -0,0 +1,244 @@
+"""
+Grid index over parsed coordinates for box, radius and polygon region queries.
+
+Points are bucketed into fixed size latitude/longitude cells and sorted by cell, so the points
+of one row of cells are a contiguous run that is found with a binary search. A query only reads
+the runs of the rows its bounding box covers and then tests those candidates exactly, so many
+regions can be checked against a large export without scanning every record for each one.
+"""
+
+import math
+import numpy as np
+from .store import E7, StringTable, TimelineStore
+from .filters import create_search_grid
+
+CELL_E7 = 100000
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+METRES_PER_E7 = METRES_PER_DEGREE / E7
+LAT_OFFSET_E7 = 90 * E7
+LONG_OFFSET_E7 = 180 * E7
+
+
+class Region:
+    """A named search area: kind is 'box', 'radius' or 'polygon'. Boxes are
+    (min_lat, max_lat, min_long, max_long), radius areas are ((lat, long), metres) and
+    polygons are a list of (lat, long) vertices, all in degrees."""
+
+    __slots__ = ("name", "kind", "shape")
+
+    def __init__(self, name, kind, shape):
+        self.name = name
+        self.kind = kind
+        self.shape = shape
+
+    def bounds(self):
+        """Returns the (min_lat, max_lat, min_long, max_long) box enclosing the region. The
+        longitudes of a region crossing the antimeridian run past -180 or 180."""
+        if self.kind == "box":
+            return self.shape
+        if self.kind == "radius":
+            (lat, long), metres = self.shape
+            lat_delta = metres / METRES_PER_DEGREE
+            cos_lat = math.cos(math.radians(lat))
+            long_delta = 180 if cos_lat < 1e-9 else min(lat_delta / cos_lat, 180)
+            return (lat - lat_delta, lat + lat_delta, long - long_delta, long + long_delta)
+        lats = [lat for lat, _ in self.shape]
+        longs = [long for _, long in self.shape]
+        return (min(lats), max(lats), min(longs), max(longs))
+
+    def contains(self, lat, long):
+        """lat and long are arrays of degrees; returns a boolean mask"""
+        if self.kind == "box":
+            min_lat, max_lat, min_long, max_long = self.shape
+            long = unwrap(long, min_long)
+            return (
+                (min_lat <= lat) & (lat <= max_lat) & (min_long <= long) & (long <= max_long)
+            )
+        if self.kind == "radius":
+            (centre_lat, centre_long), metres = self.shape
+            return haversine_m(centre_lat, centre_long, lat, long) <= metres
+        # Even-odd rule: count the polygon edges crossed by a ray heading east of each point
+        inside = np.zeros(len(lat), dtype=bool)
+        vertices = self.shape
+        long = unwrap(long, min(vertex_long for _, vertex_long in vertices))
+        for (lat1, long1), (lat2, long2) in zip(vertices, vertices[1:] + vertices[:1]):
+            if lat1 == lat2:
+                continue
+            spans = (lat1 > lat) != (lat2 > lat)
+            crossing = long1 + (lat - lat1) * (long2 - long1) / (lat2 - lat1)
+            inside ^= spans & (long < crossing)
+        return inside
+
+
+def unwrap(long, west):
+    """Shifts longitudes by whole turns into the 360 degrees east of west, so that they
+    compare with the longitudes of a region that runs past 180"""
+    return west + (np.asarray(long) - west) % 360
+
+
+def haversine_m(lat1, long1, lat2, long2):
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def parse_point(value):
+    lat, long = (float(part) for part in value.split(","))
+    return lat, long
+
+
+def parse_region(line):
+    """Parses one line of a regions file:
+    name;box;lat,long;lat,long
+    name;radius;lat,long;metres
+    name;polygon;lat,long;lat,long;lat,long[;...]"""
+    name, kind, *values = (field.strip() for field in line.split(";"))
+    kind = kind.lower()
+    if not name:
+        raise ValueError("missing region name")
+    if kind == "box" and len(values) == 2:
+        return Region(
+            name, kind, create_search_grid(parse_point(values[0]), parse_point(values[1]))
+        )
+    if kind == "radius" and len(values) == 2:
+        return Region(name, kind, (parse_point(values[0]), float(values[1])))
+    if kind == "polygon" and len(values) >= 3:
+        return Region(name, kind, [parse_point(value) for value in values])
+    raise ValueError(f"cannot read a {kind} region from {len(values)} values")
+
+
+def load_regions(path):
+    """Reads a regions file, one region per line. Blank lines and lines starting with # are
+    ignored. Raises OSError for a file that cannot be read and ValueError for one without
+    valid regions."""
+    regions = []
+    try:
+        with open(path, "r", encoding="utf-8") as regions_file:
+            for number, line in enumerate(regions_file, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    regions.append(parse_region(line))
+                except ValueError as err:
+                    raise ValueError(
+                        f"Unable to read region on line {number} of {path}: {err}"
+                    ) from err
+    except OSError as err:
+        raise OSError(f"Unable to read regions file {path}: {err}") from err
+    if not regions:
+        raise ValueError(f"No regions found in {path}")
+    return regions
+
+
+class GridIndex:
+    """Sorted cell index over E7 latitude/longitude columns. Each point keeps the record it
+    came from in `records`, so that a record can be indexed by more than one point."""
+
+    def __init__(self, latitude, longitude, records=None, cell_e7=CELL_E7):
+        latitude = np.asarray(latitude, dtype=np.int64)
+        longitude = np.asarray(longitude, dtype=np.int64)
+        self.cell_e7 = cell_e7
+        self.rows = 2 * LAT_OFFSET_E7 // cell_e7 + 1
+        self.columns = 2 * LONG_OFFSET_E7 // cell_e7 + 1
+        cells = self.cell_ids(latitude, longitude)
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.latitude = latitude[order] / E7
+        self.longitude = longitude[order] / E7
+        if records is None:
+            records = np.arange(len(latitude))
+        self.records = np.asarray(records, dtype=np.int64)[order]
+
+    @classmethod
+    def from_store(cls, store, cell_e7=CELL_E7):
+        """Indexes each location, or the start and end points of each timeline entry"""
+        if not isinstance(store, TimelineStore):
+            return cls(store.latitude, store.longitude, cell_e7=cell_e7)
+        records = np.arange(len(store))
+        return cls(
+            np.concatenate([store.start_latitude, store.end_latitude]),
+            np.concatenate([store.start_longitude, store.end_longitude]),
+            np.concatenate([records, records]),
+            cell_e7,
+        )
+
+    def __len__(self):
+        return len(self.cells)
+
+    def rows_and_columns(self, latitude, longitude):
+        rows = (np.asarray(latitude) + LAT_OFFSET_E7) // self.cell_e7
+        columns = (np.asarray(longitude) + LONG_OFFSET_E7) // self.cell_e7
+        return np.clip(rows, 0, self.rows - 1), np.clip(columns, 0, self.columns - 1)
+
+    def cell_ids(self, latitude, longitude):
+        rows, columns = self.rows_and_columns(latitude, longitude)
+        return rows * self.columns + columns
+
+    def candidates(self, min_lat, max_lat, min_long, max_long):
+        """Returns the positions of the points in the cells overlapping a box in degrees. A
+        box running past -180 or 180 is wrapped, and searched as the two boxes on either
+        side of the antimeridian."""
+        if max_long - min_long >= 360:
+            return self.box_candidates(min_lat, max_lat, -180, 180)
+        west = (min_long + 180) % 360 - 180
+        east = west + (max_long - min_long)
+        if east <= 180:
+            return self.box_candidates(min_lat, max_lat, west, east)
+        return np.concatenate(
+            [
+                self.box_candidates(min_lat, max_lat, west, 180),
+                self.box_candidates(min_lat, max_lat, -180, east - 360),
+            ]
+        )
+
+    def box_candidates(self, min_lat, max_lat, min_long, max_long):
+        """candidates for a box within -180 to 180"""
+        low = [math.floor(min_lat * E7), math.floor(min_long * E7)]
+        high = [math.ceil(max_lat * E7), math.ceil(max_long * E7)]
+        (first_row, last_row), (first_column, last_column) = self.rows_and_columns(
+            np.array([low[0], high[0]]), np.array([low[1], high[1]])
+        )
+        rows = np.arange(first_row, last_row + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.cells, rows + first_column, side="left")
+        stops = np.searchsorted(self.cells, rows + last_column, side="right")
+        counts = stops - starts
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(starts - offsets, counts) + np.arange(total)
+
+    def query(self, region):
+        """Returns the sorted, unique records with a point inside the region"""
+        positions = self.candidates(*region.bounds())
+        inside = region.contains(self.latitude[positions], self.longitude[positions])
+        return np.unique(self.records[positions[inside]])
+
+
+def search_regions(store, regions, cell_e7=CELL_E7):
+    """Keeps the records inside any of the regions, labelled with the names of the regions
+    each one falls in, in the order the regions were given"""
+    index = GridIndex.from_store(store, cell_e7)
+    hits = [index.query(region) for region in regions]
+    records = np.concatenate(hits)
+    numbers = np.repeat(np.arange(len(regions)), [len(found) for found in hits])
+    order = np.lexsort((numbers, records))
+    records, numbers = records[order], numbers[order]
+    matched, starts = np.unique(records, return_index=True)
+    names = [region.name for region in regions]
+    labels = {}
+    table = StringTable()
+    codes = np.empty(len(matched), dtype=np.uint32)
+    groups = np.split(numbers, starts[1:]) if len(matched) else []
+    for position, group in enumerate(groups):
+        key = tuple(group.tolist())
+        code = labels.get(key)
+        if code is None:
+            code = labels[key] = table.encode(", ".join(names[i] for i in key))
+        codes[position] = code
+    return store.take(matched).with_regions(codes, table)
@@ -0,0 +1,93 @@
+"""
+Out-of-core sorting for location histories which do not fit in memory.
+
+Once a builder's columns grow past its memory budget they are sorted by time and written out as
+a run of .npy files, one per column. When parsing finishes the runs are merged a block at a time
+into memory mapped output columns, so that no more than about one budget's worth of records has
+to be held in memory at any point.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+def spill_directory(parent=None):
+    """Creates a temporary directory for runs which is removed when the process exits"""
+    directory = tempfile.mkdtemp(prefix="gtl-sort-", dir=parent)
+    atexit.register(shutil.rmtree, directory, True)
+    return directory
+
+
+def write_run(directory, columns, key, number):
+    """Sorts the columns by the key column, keeping the original order for ties, and saves
+    them as directory/run_<number>/<name>.npy"""
+    order = np.argsort(columns[key], kind="stable")
+    run = os.path.join(directory, f"run_{number}")
+    os.makedirs(run)
+    for name, column in columns.items():
+        np.save(os.path.join(run, f"{name}.npy"), column[order])
+    return run
+
+
+def load_run(run, names):
+    return {
+        name: np.load(os.path.join(run, f"{name}.npy"), mmap_mode="r") for name in names
+    }
+
+
+def merge_runs(runs, directory, names, key, block_rows):
+    """K-way merges sorted runs into memory mapped columns saved under directory, reading at
+    most block_rows rows of each run at a time. Records with the same key keep the order of
+    their runs, so the merge is stable."""
+    sources = [load_run(run, names) for run in runs]
+    lengths = [len(source[key]) for source in sources]
+    total = sum(lengths)
+    output = {
+        name: np.lib.format.open_memmap(
+            os.path.join(directory, f"{name}.npy"),
+            mode="w+",
+            dtype=sources[0][name].dtype,
+            shape=(total,),
+        )
+        for name in names
+    }
+    positions = [0] * len(sources)
+    written = 0
+    while written < total:
+        active = [run for run in range(len(sources)) if positions[run] < lengths[run]]
+        ends = {
+            run: min(positions[run] + block_rows, lengths[run]) for run in active
+        }
+        # Nothing still unread can sort before the smallest of the last keys read from
+        # each run, with ties between runs broken by run number
+        last = min(active, key=lambda run: (sources[run][key][ends[run] - 1], run))
+        cutoff = sources[last][key][ends[last] - 1]
+        parts = []
+        for run in active:
+            block = sources[run][key][positions[run] : ends[run]]
+            if run < last:
+                count = int(np.searchsorted(block, cutoff, side="right"))
+            elif run > last:
+                count = int(np.searchsorted(block, cutoff, side="left"))
+            else:
+                count = len(block)
+            parts.append((run, positions[run], positions[run] + count))
+        order = np.argsort(
+            np.concatenate([sources[run][key][start:end] for run, start, end in parts]),
+            kind="stable",
+        )
+        stop = written + len(order)
+        for name in names:
+            merged = np.concatenate(
+                [sources[run][name][start:end] for run, start, end in parts]
+            )
+            output[name][written:stop] = merged[order]
+        for run, _, end in parts:
+            positions[run] = end
+        written = stop
+    for column in output.values():
+        column.flush()
+    return output
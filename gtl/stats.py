@@ -0,0 +1,184 @@
+"""
+Run statistics for --stats and the --progress line.
+
+Stats times each stage of a run, counts the records read, filtered out and emitted, and records
+the size of every output file and the peak resident memory, then writes it all as JSON.
+Stages can be nested, in which case each stage is credited only with the time not spent in
+the stages inside it, so the stages add up to the run time. Stages timed in worker processes
+run alongside the stage that waits for them and are kept under worker_ names, which are not
+part of that sum. Progress draws a single status line on stderr with the rate and, when
+the total is known, the time remaining.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime as dt, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1 << 20
+PROGRESS_INTERVAL = 0.5
+PROGRESS_STEP = 4096
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in bytes, or None where the
+    resource module is not available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def megabytes(size):
+    return round(size / MB, 1) if size is not None else None
+
+
+class Stats:
+    def __init__(self, **details):
+        self.details = details
+        self.started = dt.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.stack = []
+        self.records = {}
+        self.outputs = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage, less the time spent in any stage nested inside it"""
+        entry = self.stages.setdefault(name, {"stage": name, "seconds": 0.0})
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            entry["seconds"] += elapsed - nested
+            entry["peak_rss_mb"] = megabytes(peak_rss())
+
+    def merge(self, stages, prefix="worker_"):
+        """Adds stage entries timed by a worker process to this run's, under prefixed names
+        as they overlap the stage of this run that waited for them"""
+        for other in stages:
+            name = f"{prefix}{other['stage']}"
+            entry = self.stages.setdefault(name, {"stage": name, "seconds": 0.0})
+            entry["seconds"] += other["seconds"]
+            peaks = [entry.get("peak_rss_mb"), other.get("peak_rss_mb")]
+            entry["peak_rss_mb"] = max((peak for peak in peaks if peak), default=None)
+
+    def count(self, name, value):
+        self.records[name] = self.records.get(name, 0) + int(value)
+
+    def add_outputs(self, paths):
+        for path in paths or ():
+            if os.path.isfile(path):
+                self.outputs.append({"path": path, "bytes": os.path.getsize(path)})
+
+    def report(self):
+        stages = [
+            dict(entry, seconds=round(entry["seconds"], 6))
+            for entry in self.stages.values()
+        ]
+        return {
+            **self.details,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - self.start, 6),
+            "records": self.records,
+            "stages": stages,
+            "peak_rss_mb": megabytes(peak_rss()),
+            "outputs": self.outputs,
+            "output_bytes": sum(output["bytes"] for output in self.outputs),
+        }
+
+    def write(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as stats_file:
+                json.dump(self.report(), stats_file, indent=2)
+                stats_file.write("\n")
+        except OSError as err:
+            print(f"[!] Unable to write stats: {err}")
+            return
+        print(f"[+] Stats written to {path}")
+
+
+def stage(stats, name):
+    """Stats.stage, or nothing when stats are not being collected"""
+    return stats.stage(name) if stats else nullcontext()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class Progress:
+    """A status line such as '[-] Excel: 120,000/1,500,000 records 85,000 records/s ETA
+    0:00:16', redrawn at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, label, total=None, output=None):
+        self.label = label
+        self.total = total
+        self.output = output or sys.stderr
+        self.done = 0
+        self.start = time.perf_counter()
+        self.drawn = 0.0
+
+    def advance(self, count=1):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.drawn >= PROGRESS_INTERVAL:
+            self.drawn = now
+            self.draw(now)
+
+    def wrap(self, iterable):
+        """Yields the items of iterable, counting them as they go"""
+        count = 0
+        for item in iterable:
+            yield item
+            count += 1
+            if count == PROGRESS_STEP:
+                self.advance(count)
+                count = 0
+        self.advance(count)
+
+    def draw(self, now):
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0
+        line = f"[-] {self.label}: {self.done:,}"
+        if self.total:
+            line += f"/{self.total:,}"
+        line += f" records {rate:,.0f} records/s"
+        if self.total and rate:
+            line += f" ETA {format_duration((self.total - self.done) / rate)}"
+        self.output.write(f"\r{line}\033[K")
+        self.output.flush()
+
+    def close(self):
+        self.draw(time.perf_counter())
+        self.output.write("\n")
+        self.output.flush()
+
+
+@contextmanager
+def progress(enabled, label, total=None):
+    """Yields a Progress line when enabled, otherwise None"""
+    if not enabled:
+        yield None
+        return
+    line = Progress(label, total)
+    try:
+        yield line
+    finally:
+        line.close()
@@ -0,0 +1,463 @@
+"""
+Columnar containers for parsed Google Takeout location and timeline records.
+
+Each field is held in a single typed array instead of one Python list per record. Coordinates
+are kept as the integer E7 values found in the export, timestamps as epoch milliseconds and
+repeated text fields (source, device tag, activity type etc.) are dictionary encoded. Timeline
+waypoints are stored in CSR form: one flat array of points and an offsets array per record.
+"""
+
+from array import array
+import shutil
+import numpy as np
+from .spill import merge_runs, spill_directory, write_run
+from .timeutil import TimeIndex, is_sorted, parse_timestamps
+
+E7 = 10000000
+INT32_MIN = -(2**31)
+INT32_MAX = 2**31 - 1
+ACTIVITY_SEGMENT = 0
+PLACE_VISIT = 1
+KINDS = ("activitySegment", "placeVisit")
+
+
+def signed_e7(value, timestamp):
+    """Some exports hold negative E7 coordinates as their unsigned 32-bit value, which is
+    wrapped back. Raises ValueError naming the record for any other out of range value."""
+    if value > INT32_MAX:
+        value -= 2**32
+    if not INT32_MIN <= value <= INT32_MAX:
+        raise ValueError(f"The record at {timestamp} has an out of range coordinate {value}")
+    return value
+
+
+class StringTable:
+    """Dictionary encodes repeated values as small integer codes"""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self, values=None):
+        self.values = list(values or [])
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, codes):
+        values = self.values
+        return [values[code] for code in codes.tolist()]
+
+
+class ColumnStore:
+    """Base class for a set of equal length typed columns. COLUMNS lists (name, typecode)
+    pairs using array module typecodes; TABLES names the columns which hold StringTable codes"""
+
+    COLUMNS = ()
+    TABLES = ()
+    TIME_COLUMNS = ()
+
+    def __init__(self, columns=None, tables=None, tz="UTC"):
+        columns = columns or {}
+        tables = tables or {}
+        self.tz = tz
+        self.region = None
+        self.region_table = None
+        self.index = None
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, np.asarray(columns.get(name, ()), dtype=typecode))
+        for name in self.TABLES:
+            setattr(self, f"{name}_table", tables.get(name) or StringTable())
+
+    def __len__(self):
+        return len(getattr(self, self.COLUMNS[0][0]))
+
+    @property
+    def columns(self):
+        return {name: getattr(self, name) for name, _ in self.COLUMNS}
+
+    @property
+    def tables(self):
+        return {name: getattr(self, f"{name}_table") for name in self.TABLES}
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name, _ in self.COLUMNS)
+
+    def decode(self, name, start=0, stop=None):
+        """Returns the decoded values of a dictionary encoded column"""
+        return getattr(self, f"{name}_table").decode(getattr(self, name)[start:stop])
+
+    @classmethod
+    def concat_columns(cls, stores):
+        """Returns the joined columns and merged string tables of several stores"""
+        columns = {
+            name: np.concatenate([getattr(store, name) for store in stores])
+            for name, _ in cls.COLUMNS
+            if name not in cls.TABLES
+        }
+        tables = {}
+        for name in cls.TABLES:
+            table = StringTable()
+            codes = []
+            for store in stores:
+                values = getattr(store, f"{name}_table").values
+                remap = np.array([table.encode(value) for value in values], np.uint32)
+                codes.append(remap[getattr(store, name)])
+            columns[name] = np.concatenate(codes)
+            tables[name] = table
+        return columns, tables
+
+    @classmethod
+    def concat(cls, stores, tz="UTC"):
+        """Joins stores of this type one after the other into a single store"""
+        columns, tables = cls.concat_columns(stores)
+        return cls(columns, tables, tz)
+
+    def time_index(self):
+        """Returns the TimeIndex over TIME_COLUMNS, building it on first use"""
+        if self.index is None:
+            self.index = TimeIndex(*(getattr(self, name) for name in self.TIME_COLUMNS))
+        return self.index
+
+    def with_regions(self, codes, table):
+        """Labels each record with the search regions it was found in. The labels are not
+        part of COLUMNS, so they are only present on the results of a region search."""
+        self.region = np.asarray(codes, dtype=np.uint32)
+        self.region_table = table
+        return self
+
+    def regions(self, start=0, stop=None):
+        """Returns the region labels of the records, or None if there are none"""
+        if self.region is None:
+            return None
+        return self.region_table.decode(self.region[start:stop])
+
+    def copy_regions(self, store, indices=slice(None)):
+        if self.region is not None:
+            store.with_regions(self.region[indices], self.region_table)
+        return store
+
+    def take(self, indices):
+        """Returns a new store holding only the records at the given indices or mask"""
+        columns = {name: getattr(self, name)[indices] for name, _ in self.COLUMNS}
+        return self.copy_regions(type(self)(columns, self.tables, self.tz), indices)
+
+    def compact(self):
+        """Returns a copy whose string tables only hold the values still referenced, which
+        keeps a small slice of a large store cheap to pickle"""
+        columns = self.columns
+        tables = {}
+        for name in self.TABLES:
+            used, codes = np.unique(columns[name], return_inverse=True)
+            columns[name] = codes.astype(np.uint32)
+            tables[name] = StringTable(getattr(self, f"{name}_table").decode(used))
+        return self.copy_regions(type(self)(columns, tables, self.tz))
+
+    def sort_by(self, name):
+        """Returns the store ordered by the given column, keeping the original order for ties.
+        Exports are usually already in time order, in which case nothing is copied."""
+        values = getattr(self, name)
+        if is_sorted(values):
+            return self
+        return self.take(np.argsort(values, kind="stable"))
+
+
+class ColumnBuilder:
+    """Accumulates records for a ColumnStore in compact growable arrays"""
+
+    def __init__(self, store_type, tz="UTC"):
+        self.store_type = store_type
+        self.tz = tz
+        self.columns = {name: array(typecode) for name, typecode in store_type.COLUMNS}
+        self.tables = {name: StringTable() for name in store_type.TABLES}
+
+    def __len__(self):
+        return len(self.columns[self.store_type.COLUMNS[0][0]])
+
+    def build(self):
+        columns = {
+            name: np.frombuffer(column, dtype=column.typecode)
+            for name, column in self.columns.items()
+        }
+        return self.store_type(columns, self.tables, self.tz)
+
+
+class LocationStore(ColumnStore):
+    """Raw location fixes from a Records.json export"""
+
+    COLUMNS = (
+        ("timestamp", "q"),
+        ("latitude", "i"),
+        ("longitude", "i"),
+        ("accuracy", "i"),
+        ("source", "I"),
+        ("device_tag", "I"),
+        ("device_designation", "I"),
+        ("activity_timestamp", "q"),
+        ("motions", "I"),
+    )
+    TABLES = ("source", "device_tag", "device_designation", "motions")
+    TIME_COLUMNS = ("timestamp",)
+
+
+class LocationBuilder(ColumnBuilder):
+    """Timestamps are appended as the ISO strings found in the export and converted to epoch
+    milliseconds in bulk, chunk_size records at a time.
+
+    With a memory_budget (in bytes) the records are sorted out of core: each time the columns
+    pass the budget they are sorted by timestamp and spilled to a run on disk under spill_dir
+    (the system temporary directory by default), and build() merges the runs into a store of
+    memory mapped columns which is already in time order."""
+
+    def __init__(self, tz="UTC", chunk_size=65536, memory_budget=None, spill_dir=None):
+        super().__init__(LocationStore, tz)
+        self.chunk_size = chunk_size
+        self.pending = {"timestamp": [], "activity_timestamp": []}
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.directory = None
+        self.runs = []
+
+    def __len__(self):
+        return len(self.columns["latitude"])
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def flush(self):
+        for name, timestamps in self.pending.items():
+            self.columns[name].frombytes(parse_timestamps(timestamps).tobytes())
+            timestamps.clear()
+        if self.memory_budget and self.nbytes >= self.memory_budget:
+            self.spill()
+
+    def spill(self):
+        if self.directory is None:
+            self.directory = spill_directory(self.spill_dir)
+        columns = {
+            name: np.frombuffer(column, dtype=column.typecode)
+            for name, column in self.columns.items()
+        }
+        self.runs.append(
+            write_run(self.directory, columns, "timestamp", len(self.runs))
+        )
+        self.columns = {
+            name: array(typecode) for name, typecode in LocationStore.COLUMNS
+        }
+
+    def build(self):
+        self.flush()
+        if not self.runs:
+            return super().build()
+        if len(self):
+            self.spill()
+        names = [name for name, _ in LocationStore.COLUMNS]
+        record_bytes = sum(
+            np.dtype(typecode).itemsize for _, typecode in LocationStore.COLUMNS
+        )
+        # Every run contributes a block to each merge step, which is then copied once
+        block_rows = max(
+            4096, self.memory_budget // record_bytes // (2 * len(self.runs))
+        )
+        columns = merge_runs(self.runs, self.directory, names, "timestamp", block_rows)
+        for run in self.runs:
+            shutil.rmtree(run, ignore_errors=True)
+        return LocationStore(columns, self.tables, self.tz)
+
+    def append(
+        self,
+        timestamp,
+        latitude,
+        longitude,
+        accuracy,
+        source,
+        device_tag,
+        device_designation,
+        activity_timestamp,
+        motions,
+    ):
+        columns = self.columns
+        tables = self.tables
+        pending = self.pending
+        if not (
+            INT32_MIN <= latitude <= INT32_MAX and INT32_MIN <= longitude <= INT32_MAX
+        ):
+            latitude = signed_e7(latitude, timestamp)
+            longitude = signed_e7(longitude, timestamp)
+        pending["timestamp"].append(timestamp)
+        columns["latitude"].append(latitude)
+        columns["longitude"].append(longitude)
+        columns["accuracy"].append(accuracy)
+        columns["source"].append(tables["source"].encode(source))
+        columns["device_tag"].append(tables["device_tag"].encode(device_tag))
+        columns["device_designation"].append(
+            tables["device_designation"].encode(device_designation)
+        )
+        pending["activity_timestamp"].append(activity_timestamp)
+        columns["motions"].append(tables["motions"].encode(motions))
+        if len(pending["timestamp"]) >= self.chunk_size:
+            self.flush()
+
+
+class TimelineStore(ColumnStore):
+    """Activity segments and place visits from Semantic Location History. Waypoints for
+    record i are waypoint_latitude/longitude[waypoint_offsets[i]:waypoint_offsets[i + 1]]"""
+
+    COLUMNS = (
+        ("kind", "B"),
+        ("start_timestamp", "q"),
+        ("end_timestamp", "q"),
+        ("start_latitude", "i"),
+        ("start_longitude", "i"),
+        ("end_latitude", "i"),
+        ("end_longitude", "i"),
+        ("activity_type", "I"),
+        ("confidence", "I"),
+        ("source", "I"),
+        ("detail", "I"),
+    )
+    TABLES = ("activity_type", "confidence", "source", "detail")
+    TIME_COLUMNS = ("start_timestamp", "end_timestamp")
+
+    def __init__(self, columns=None, tables=None, tz="UTC"):
+        super().__init__(columns, tables, tz)
+        columns = columns or {}
+        self.waypoint_offsets = np.asarray(
+            columns.get("waypoint_offsets", (0,)), dtype=np.int64
+        )
+        self.waypoint_latitude = np.asarray(
+            columns.get("waypoint_latitude", ()), dtype=np.int32
+        )
+        self.waypoint_longitude = np.asarray(
+            columns.get("waypoint_longitude", ()), dtype=np.int32
+        )
+
+    @property
+    def columns(self):
+        columns = super().columns
+        columns["waypoint_offsets"] = self.waypoint_offsets
+        columns["waypoint_latitude"] = self.waypoint_latitude
+        columns["waypoint_longitude"] = self.waypoint_longitude
+        return columns
+
+    @property
+    def nbytes(self):
+        return (
+            super().nbytes
+            + self.waypoint_offsets.nbytes
+            + self.waypoint_latitude.nbytes
+            + self.waypoint_longitude.nbytes
+        )
+
+    @classmethod
+    def concat_columns(cls, stores):
+        columns, tables = super().concat_columns(stores)
+        shifts = np.cumsum([0] + [len(store.waypoint_latitude) for store in stores])
+        columns["waypoint_offsets"] = np.concatenate(
+            [[0]]
+            + [
+                store.waypoint_offsets[1:] + shift
+                for store, shift in zip(stores, shifts.tolist())
+            ]
+        )
+        columns["waypoint_latitude"] = np.concatenate(
+            [store.waypoint_latitude for store in stores]
+        )
+        columns["waypoint_longitude"] = np.concatenate(
+            [store.waypoint_longitude for store in stores]
+        )
+        return columns, tables
+
+    def waypoints(self, index):
+        """Returns the (latitude, longitude) E7 pairs recorded between start and end"""
+        start, end = self.waypoint_offsets[index], self.waypoint_offsets[index + 1]
+        return list(
+            zip(
+                self.waypoint_latitude[start:end].tolist(),
+                self.waypoint_longitude[start:end].tolist(),
+            )
+        )
+
+    def take(self, indices):
+        indices = np.arange(len(self))[indices]
+        columns = {name: getattr(self, name)[indices] for name, _ in self.COLUMNS}
+        starts = self.waypoint_offsets[indices]
+        counts = self.waypoint_offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        points = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        columns["waypoint_offsets"] = offsets
+        columns["waypoint_latitude"] = self.waypoint_latitude[points]
+        columns["waypoint_longitude"] = self.waypoint_longitude[points]
+        return self.copy_regions(type(self)(columns, self.tables, self.tz), indices)
+
+
+class TimelineBuilder(ColumnBuilder):
+    def __init__(self, tz="UTC"):
+        super().__init__(TimelineStore, tz)
+        self.waypoint_offsets = array("q", [0])
+        self.waypoint_latitude = array("i")
+        self.waypoint_longitude = array("i")
+
+    def append(
+        self,
+        kind,
+        start_timestamp,
+        end_timestamp,
+        start_latitude,
+        start_longitude,
+        end_latitude,
+        end_longitude,
+        waypoints,
+        activity_type,
+        confidence,
+        source,
+        detail,
+    ):
+        columns = self.columns
+        tables = self.tables
+        coordinates = (start_latitude, start_longitude, end_latitude, end_longitude)
+        if not all(INT32_MIN <= value <= INT32_MAX for value in coordinates):
+            start_latitude, start_longitude, end_latitude, end_longitude = (
+                signed_e7(value, start_timestamp) for value in coordinates
+            )
+        columns["kind"].append(kind)
+        columns["start_timestamp"].append(start_timestamp)
+        columns["end_timestamp"].append(end_timestamp)
+        columns["start_latitude"].append(start_latitude)
+        columns["start_longitude"].append(start_longitude)
+        columns["end_latitude"].append(end_latitude)
+        columns["end_longitude"].append(end_longitude)
+        for latitude, longitude in waypoints:
+            if not (
+                INT32_MIN <= latitude <= INT32_MAX and INT32_MIN <= longitude <= INT32_MAX
+            ):
+                latitude = signed_e7(latitude, start_timestamp)
+                longitude = signed_e7(longitude, start_timestamp)
+            self.waypoint_latitude.append(latitude)
+            self.waypoint_longitude.append(longitude)
+        self.waypoint_offsets.append(len(self.waypoint_latitude))
+        columns["activity_type"].append(tables["activity_type"].encode(activity_type))
+        columns["confidence"].append(tables["confidence"].encode(confidence))
+        columns["source"].append(tables["source"].encode(source))
+        columns["detail"].append(tables["detail"].encode(detail))
+
+    def build(self):
+        store = super().build()
+        store.waypoint_offsets = np.frombuffer(self.waypoint_offsets, dtype=np.int64)
+        store.waypoint_latitude = np.frombuffer(self.waypoint_latitude, dtype=np.int32)
+        store.waypoint_longitude = np.frombuffer(
+            self.waypoint_longitude, dtype=np.int32
+        )
+        return store
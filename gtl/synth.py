@@ -0,0 +1,312 @@
+"""
+Synthetic Google Takeout location data for testing and benchmarking.
+
+Writes a Records.json of raw location fixes and/or a Semantic Location History tree of
+YYYY/YYYY_MONTH.json timeline files with the same structure as a real export: several devices
+wandering around their own home area, a fix every few seconds to few minutes with occasional
+gaps, activity recognition on some fixes, and alternating place visits and activity segments
+with waypoint paths. Records are generated and written a chunk at a time, so even very large
+files need little memory.
+
+    python -m gtl.synth --records 1000000 --timeline 20000 -o synthetic
+"""
+
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+CHUNK_SIZE = 100000
+START_MS = 1546300800000
+SOURCES = np.array(["WIFI", "GPS", "CELL"])
+SOURCE_WEIGHTS = [0.6, 0.3, 0.1]
+MOTIONS = ["STILL", "ON_FOOT", "WALKING", "IN_VEHICLE", "ON_BICYCLE", "TILTING", "UNKNOWN"]
+ACTIVITY_TYPES = ["WALKING", "IN_PASSENGER_VEHICLE", "CYCLING", "IN_BUS", "RUNNING"]
+SEMANTIC_TYPES = ["TYPE_HOME", "TYPE_WORK", "TYPE_SEARCHED_ADDRESS", None]
+CONFIDENCES = ["HIGH_CONFIDENCE", "MEDIUM_CONFIDENCE", "LOW_CONFIDENCE"]
+MONTHS = [
+    "JANUARY",
+    "FEBRUARY",
+    "MARCH",
+    "APRIL",
+    "MAY",
+    "JUNE",
+    "JULY",
+    "AUGUST",
+    "SEPTEMBER",
+    "OCTOBER",
+    "NOVEMBER",
+    "DECEMBER",
+]
+
+
+def iso_timestamps(epoch_ms):
+    """Formats epoch milliseconds as the export does, e.g. 2019-01-01T00:02:21.891Z"""
+    stamps = np.datetime_as_string(
+        np.asarray(epoch_ms).astype("datetime64[ms]"), unit="ms"
+    )
+    return [f"{stamp}Z" for stamp in stamps.tolist()]
+
+
+def random_walk(rng, count, home, step_e7):
+    """Returns count E7 positions drifting away from and back towards a home position"""
+    steps = rng.normal(0, step_e7, count).cumsum()
+    drift = steps - np.convolve(steps, np.ones(50) / 50, mode="same")
+    return (home + drift).astype(np.int64)
+
+
+class Device:
+    def __init__(self, rng, number):
+        self.tag = int(rng.integers(-(2**31), 2**31))
+        self.primary = number == 0
+        self.home = (
+            int((rng.uniform(-50, 60)) * 1e7),
+            int((rng.uniform(-150, 150)) * 1e7),
+        )
+
+
+def location_records(rng, count, devices):
+    """Yields location records as JSON text, in time order"""
+    devices = [Device(rng, number) for number in range(devices)]
+    time_ms = START_MS
+    for start in range(0, count, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, count - start)
+        owners = rng.integers(0, len(devices), size)
+        # Mostly a fix every few seconds to few minutes, with the odd gap of hours
+        gaps = np.where(
+            rng.random(size) < 0.002,
+            rng.integers(3600000, 86400000, size),
+            rng.lognormal(10.5, 1.2, size).astype(np.int64) + 1000,
+        )
+        timestamps = time_ms + gaps.cumsum()
+        time_ms = int(timestamps[-1])
+        latitude = np.empty(size, dtype=np.int64)
+        longitude = np.empty(size, dtype=np.int64)
+        for number, device in enumerate(devices):
+            mine = owners == number
+            latitude[mine] = random_walk(rng, int(mine.sum()), device.home[0], 2000)
+            longitude[mine] = random_walk(rng, int(mine.sum()), device.home[1], 3000)
+        stamps = iso_timestamps(timestamps)
+        accuracy = rng.lognormal(3, 1.2, size).astype(np.int64) + 3
+        sources = rng.choice(SOURCES, size, p=SOURCE_WEIGHTS).tolist()
+        has_activity = (rng.random(size) < 0.3).tolist()
+        confidences = rng.integers(1, 101, (size, 3)).tolist()
+        motions = rng.integers(0, len(MOTIONS), (size, 3)).tolist()
+        for i in range(size):
+            device = devices[owners[i]]
+            record = (
+                f'{{"latitudeE7": {latitude[i]}, "longitudeE7": {longitude[i]}, '
+                f'"accuracy": {accuracy[i]}, "source": "{sources[i]}", '
+                f'"deviceTag": {device.tag}, "timestamp": "{stamps[i]}"'
+            )
+            if device.primary:
+                record += ', "deviceDesignation": "PRIMARY"'
+            if has_activity[i]:
+                activity = ", ".join(
+                    f'{{"type": "{MOTIONS[motion]}", "confidence": {confidence}}}'
+                    for motion, confidence in zip(motions[i], confidences[i])
+                )
+                record += (
+                    f', "activity": [{{"activity": [{activity}], '
+                    f'"timestamp": "{stamps[i]}"}}]'
+                )
+            yield record + "}"
+
+
+def write_records(path, count, devices=3, seed=0):
+    """Writes a Records.json with count location fixes from the given number of devices"""
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as output:
+        output.write('{\n  "locations": [')
+        for number, record in enumerate(location_records(rng, count, devices)):
+            output.write(",\n    " if number else "\n    ")
+            output.write(record)
+        output.write("\n  ]\n}\n")
+
+
+def position(rng, home, spread_e7):
+    return (
+        int(home[0] + rng.normal(0, spread_e7)),
+        int(home[1] + rng.normal(0, spread_e7)),
+    )
+
+
+def place_visit(rng, number, home, start_ms, end_ms, device_tag):
+    lat, long = position(rng, home, 200000)
+    location = {
+        "latitudeE7": lat,
+        "longitudeE7": long,
+        "placeId": f"ChIJ{number:012d}",
+        "address": f"{number % 9000 + 1} Synthetic St",
+        "name": f"Place {number % 500}",
+        "sourceInfo": {"deviceTag": device_tag},
+        "locationConfidence": round(float(rng.uniform(20, 100)), 4),
+    }
+    semantic_type = SEMANTIC_TYPES[number % len(SEMANTIC_TYPES)]
+    if semantic_type:
+        location["semanticType"] = semantic_type
+    visit = {
+        "location": location,
+        "duration": {
+            "startTimestampMs": str(start_ms),
+            "endTimestampMs": str(end_ms),
+        },
+        "placeConfidence": CONFIDENCES[number % len(CONFIDENCES)],
+    }
+    if number % 3 == 0:
+        visit["simplifiedRawPath"] = {
+            "points": [
+                dict(zip(("latE7", "lngE7"), position(rng, (lat, long), 5000)))
+                for _ in range(int(rng.integers(1, 4)))
+            ]
+        }
+    return {"placeVisit": visit}
+
+
+def activity_segment(rng, number, home, start_ms, end_ms, device_tag):
+    start, end = position(rng, home, 200000), position(rng, home, 200000)
+    activity_type = ACTIVITY_TYPES[number % len(ACTIVITY_TYPES)]
+    probabilities = sorted(rng.uniform(0, 100, 3).tolist(), reverse=True)
+    segment = {
+        "startLocation": {
+            "latitudeE7": start[0],
+            "longitudeE7": start[1],
+            "sourceInfo": {"deviceTag": device_tag},
+        },
+        "endLocation": {
+            "latitudeE7": end[0],
+            "longitudeE7": end[1],
+            "sourceInfo": {"deviceTag": device_tag},
+        },
+        "duration": {
+            "startTimestampMs": str(start_ms),
+            "endTimestampMs": str(end_ms),
+        },
+        "distance": int(rng.integers(100, 40000)),
+        "activityType": activity_type,
+        "confidence": CONFIDENCES[number % len(CONFIDENCES)],
+        "activities": [
+            {"activityType": name, "probability": probability}
+            for name, probability in zip(
+                [activity_type] + ACTIVITY_TYPES[:2], probabilities
+            )
+        ],
+    }
+    points = int(rng.integers(0, 12))
+    path = np.linspace(start, end, points + 2)[1:-1]
+    if points:
+        segment["waypointPath"] = {
+            "waypoints": [{"latE7": int(lat), "lngE7": int(long)} for lat, long in path]
+        }
+    if number % 4 == 0:
+        segment["simplifiedRawPath"] = {
+            "points": [
+                {
+                    "latE7": int(lat),
+                    "lngE7": int(long),
+                    "timestampMs": str(start_ms + (end_ms - start_ms) // 2),
+                }
+                for lat, long in path[:3]
+            ]
+        }
+    return {"activitySegment": segment}
+
+
+def timeline_objects(count, seed=0):
+    """Yields ((year, month), object) for count timeline objects in time order, alternating
+    place visits and activity segments"""
+    rng = np.random.default_rng(seed)
+    home = (int(rng.uniform(-50, 60) * 1e7), int(rng.uniform(-150, 150) * 1e7))
+    device_tag = int(rng.integers(-(2**31), 2**31))
+    time_ms = START_MS
+    for number in range(count):
+        day = np.datetime64(time_ms, "ms").astype("datetime64[D]").astype(object)
+        duration = int(rng.lognormal(14.5, 1.0))
+        make = place_visit if number % 2 == 0 else activity_segment
+        item = make(rng, number, home, time_ms, time_ms + duration, device_tag)
+        yield (day.year, day.month), item
+        time_ms += duration
+
+
+def write_timeline(path, count, seed=0):
+    """Writes count timeline objects to a single JSON file"""
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as output:
+        output.write('{\n  "timelineObjects": [')
+        for number, (_, item) in enumerate(timeline_objects(count, seed)):
+            output.write(",\n    " if number else "\n    ")
+            output.write(json.dumps(item))
+        output.write("\n  ]\n}\n")
+
+
+def write_month(directory, year, month, items):
+    folder = os.path.join(directory, str(year))
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{year}_{MONTHS[month - 1]}.json")
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump({"timelineObjects": items}, output, indent=2)
+    return path
+
+
+def write_semantic_history(directory, count, seed=0):
+    """Writes count timeline objects as directory/YYYY/YYYY_MONTH.json files, one month at a
+    time. Returns the paths written."""
+    current = None
+    items = []
+    paths = []
+    for month, item in timeline_objects(count, seed):
+        if month != current:
+            if items:
+                paths.append(write_month(directory, *current, items))
+            current = month
+            items = []
+        items.append(item)
+    if items:
+        paths.append(write_month(directory, *current, items))
+    return paths
+
+
+def main():
+    arg_parse = argparse.ArgumentParser(
+        description="Generate synthetic Google Takeout location data"
+    )
+    arg_parse.add_argument(
+        "-o",
+        "--output",
+        help="Output directory, default is synthetic",
+        default="synthetic",
+    )
+    arg_parse.add_argument(
+        "--records",
+        help="Number of location records to write to Records.json, default is 10000",
+        type=int,
+        default=10000,
+    )
+    arg_parse.add_argument(
+        "--timeline",
+        help="Number of timeline objects to write to Semantic Location History, "
+        "default is 0",
+        type=int,
+        default=0,
+    )
+    arg_parse.add_argument(
+        "--devices", help="Number of devices, default is 3", type=int, default=3
+    )
+    arg_parse.add_argument("--seed", help="Random seed, default is 0", type=int, default=0)
+    args = arg_parse.parse_args()
+    if args.records < 0 or args.timeline < 0 or args.devices < 1:
+        print("[!] Record counts cannot be negative and at least one device is needed")
+        sys.exit(1)
+    os.makedirs(args.output, exist_ok=True)
+    if args.records:
+        path = os.path.join(args.output, "Records.json")
+        write_records(path, args.records, args.devices, args.seed)
+        print(f"[+] {args.records} location records written to {path}")
+    if args.timeline:
+        directory = os.path.join(args.output, "Semantic Location History")
+        paths = write_semantic_history(directory, args.timeline, args.seed)
+        print(f"[+] {args.timeline} timeline objects written to {len(paths)} files")
+
+
+if __name__ == "__main__":
+    main()
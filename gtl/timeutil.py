@@ -0,0 +1,189 @@
+"""
+Bulk conversion between ISO 8601 timestamps, epoch milliseconds and formatted local times.
+
+Timestamps are parsed once into int64 epoch milliseconds and stay that way through filtering
+and sorting. Text in the selected timezone is only produced by the writers, a batch at a time.
+"""
+
+from datetime import datetime as dt, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import numpy as np
+
+EPOCH = dt(1970, 1, 1, tzinfo=timezone.utc)
+MISSING_TIMESTAMP = -(2**63)
+PROBE_SECONDS = 6 * 3600
+PAD_SECONDS = 366 * 86400
+# UTC offsets in use range from -12:00 to +14:00
+MAX_UTC_OFFSET_MS = 14 * 3600 * 1000
+
+
+def to_epoch_ms(timestamp):
+    """Converts a single ISO 8601 timestamp from the export to epoch milliseconds"""
+    parsed = dt.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_epoch_ms(epoch_ms, tz):
+    return (EPOCH + timedelta(milliseconds=int(epoch_ms))).astimezone(tz)
+
+
+def parse_timestamps(timestamps):
+    """Converts a sequence of ISO 8601 timestamps to an int64 array of epoch milliseconds in one
+    pass. UTC ('Z') timestamps, which is all the export uses, are parsed by numpy; anything else
+    falls back to datetime. None becomes MISSING_TIMESTAMP."""
+    parsed = np.full(len(timestamps), MISSING_TIMESTAMP, dtype=np.int64)
+    present = [i for i, timestamp in enumerate(timestamps) if timestamp is not None]
+    if not present:
+        return parsed
+    values = [timestamps[i] for i in present]
+    try:
+        if not all(value.endswith("Z") for value in values):
+            raise ValueError("Timestamps carry a UTC offset")
+        utc = np.array([value[:-1] for value in values], dtype="datetime64[ms]")
+        parsed[present] = utc.astype(np.int64)
+    except ValueError:
+        parsed[present] = [to_epoch_ms(value) for value in values]
+    return parsed
+
+
+def is_sorted(values):
+    return bool(np.all(values[1:] >= values[:-1]))
+
+
+class TimeIndex:
+    """Sorted views of one or more epoch millisecond columns of a store. The records with any
+    of the indexed timestamps inside a window are found with two binary searches per column,
+    and columns which are already in order are searched in place."""
+
+    def __init__(self, *columns):
+        self.orders = []
+        self.values = []
+        for column in columns:
+            if is_sorted(column):
+                self.orders.append(None)
+                self.values.append(column)
+            else:
+                order = np.argsort(column, kind="stable")
+                self.orders.append(order)
+                self.values.append(column[order])
+
+    def between(self, start_ms, end_ms):
+        """Returns the records with a timestamp from start_ms to end_ms inclusive, as a slice
+        when a single sorted column is indexed and as sorted positions otherwise"""
+        found = []
+        for order, values in zip(self.orders, self.values):
+            low = int(np.searchsorted(values, start_ms, side="left"))
+            high = int(np.searchsorted(values, end_ms, side="right"))
+            if order is None and len(self.values) == 1:
+                return slice(low, high)
+            found.append(np.arange(low, high) if order is None else order[low:high])
+        return np.unique(np.concatenate(found))
+
+
+class TzTable:
+    """The UTC offset transitions of one timezone, worked out once over the span of the data
+    and then applied to whole arrays of epoch milliseconds with a binary search. Offsets are
+    probed every PROBE_SECONDS and each change is narrowed down to the exact second."""
+
+    def __init__(self, tz="UTC"):
+        self.zone = ZoneInfo(str(tz))
+        self.fixed = str(tz) == "UTC"
+        self.start = None
+        self.end = None
+        self.transitions = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def offset_at(self, seconds):
+        offset = dt.fromtimestamp(seconds, self.zone).utcoffset()
+        return offset // timedelta(milliseconds=1)
+
+    def build(self, start, end):
+        first = start // PROBE_SECONDS * PROBE_SECONDS
+        last = -(-end // PROBE_SECONDS) * PROBE_SECONDS
+        transitions = []
+        offsets = [self.offset_at(first)]
+        previous = first
+        for probe in range(first + PROBE_SECONDS, last + 1, PROBE_SECONDS):
+            offset = self.offset_at(probe)
+            if offset != offsets[-1]:
+                low, high = previous, probe
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if self.offset_at(middle) == offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                transitions.append(high * 1000)
+                offsets.append(offset)
+            previous = probe
+        self.start, self.end = first, last
+        self.transitions = np.array(transitions, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def utc_offsets(self, epoch_ms):
+        """Returns the UTC offset in milliseconds in effect at each timestamp"""
+        epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+        if self.fixed or not len(epoch_ms):
+            return np.zeros(len(epoch_ms), dtype=np.int64)
+        start = int(epoch_ms.min()) // 1000
+        end = -(-int(epoch_ms.max()) // 1000)
+        if self.start is None or start < self.start or end > self.end:
+            # Pad by a year either side so that later batches rarely need a rebuild
+            self.build(
+                min(start, self.start if self.start is not None else start)
+                - PAD_SECONDS,
+                max(end, self.end if self.end is not None else end) + PAD_SECONDS,
+            )
+        return self.offsets[np.searchsorted(self.transitions, epoch_ms, side="right")]
+
+
+@lru_cache(maxsize=None)
+def tz_table(tz="UTC"):
+    """Returns the shared TzTable for a timezone name"""
+    return TzTable(tz)
+
+
+def local_epoch_ms(epoch_ms, tz="UTC"):
+    """Shifts UTC epoch milliseconds to the wall clock time of the given timezone"""
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    return epoch_ms + tz_table(str(tz)).utc_offsets(epoch_ms)
+
+
+def format_offset(offset_ms):
+    sign = "-" if offset_ms < 0 else "+"
+    minutes, seconds = divmod(abs(int(offset_ms)) // 1000, 60)
+    offset = f"{sign}{minutes // 60:02d}:{minutes % 60:02d}"
+    return f"{offset}:{seconds:02d}" if seconds else offset
+
+
+def format_isoformat(epoch_ms, tz="UTC", missing="None", zulu=False):
+    """Formats epoch milliseconds as datetime.isoformat(timespec="milliseconds") would in the
+    given timezone, e.g. 2019-01-01T00:02:21.891-05:00. With zulu, UTC times are written as
+    the export writes them instead, e.g. 2019-01-01T00:01:18.436Z."""
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    absent = epoch_ms == MISSING_TIMESTAMP
+    if absent.all():
+        return [missing] * len(epoch_ms)
+    epoch_ms = np.where(absent, epoch_ms[~absent][0], epoch_ms)
+    local = local_epoch_ms(epoch_ms, tz)
+    wall_clock = np.datetime_as_string(local.astype("datetime64[ms]"), unit="ms")
+    offsets = local - epoch_ms
+    labels = {offset: format_offset(offset) for offset in np.unique(offsets).tolist()}
+    if zulu and str(tz) == "UTC":
+        labels = {0: "Z"}
+    return [
+        missing if skip else f"{stamp}{labels[offset]}"
+        for stamp, offset, skip in zip(
+            wall_clock.tolist(), offsets.tolist(), absent.tolist()
+        )
+    ]
+
+
+def format_datetimes(epoch_ms, tz="UTC"):
+    """Formats epoch milliseconds as YYYY-MM-DD HH:MM:SS in the given timezone"""
+    local = local_epoch_ms(epoch_ms, tz)
+    wall_clock = np.datetime_as_string(local.astype("datetime64[ms]"), unit="s")
+    return [stamp.replace("T", " ") for stamp in wall_clock.tolist()]
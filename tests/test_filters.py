@@ -0,0 +1,26 @@
+import pytest
+from gtl.filters import SearchFilter
+
+
+@pytest.mark.parametrize(
+    "date_range, time_range",
+    [
+        ("2019-01-01", None),
+        ("2019-01-01..", None),
+        ("2019-01-01..2019-13-01", None),
+        (None, "08:00:00"),
+        (None, "08:00:00..25:00:00"),
+        ("2019-01-01..2019-01-31", "08:00:00..x"),
+    ],
+)
+def test_malformed_ranges(date_range, time_range):
+    with pytest.raises(ValueError):
+        SearchFilter("UTC", date_range, time_range)
+
+
+def test_ranges_on_their_own():
+    assert SearchFilter("UTC", "2019-01-01..2019-01-31").date_bounds == (17897, 17927)
+    assert SearchFilter("UTC", time_range="08:00:00..18:00:00").time_bounds == (
+        28800000,
+        64800000,
+    )
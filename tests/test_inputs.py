@@ -0,0 +1,14 @@
+import os
+from gtl.gtl import find_inputs, output_name
+
+
+def test_merged_output_name(tmp_path, monkeypatch):
+    """Merged output is a visible file inside the input directory, however it is named"""
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    for name in ("a.json", "b.json"):
+        (exports / name).write_text("{}", encoding="utf-8")
+    monkeypatch.chdir(exports)
+    expected = os.path.join(str(exports), "exports_merged")
+    for path in (".", str(exports), "*.json"):
+        assert output_name(path, find_inputs(path)) == expected
@@ -0,0 +1,24 @@
+import pytest
+from gtl.api import Location, to_store
+from gtl.spatial import Region, search_regions
+from gtl.store import E7
+
+POINTS = [(10.0, 179.999), (10.0, -179.999), (10.0, 0.0)]
+
+
+@pytest.mark.parametrize(
+    "region",
+    [
+        Region("radius", "radius", ((10.0, 180.0), 1000.0)),
+        Region("box", "box", (9.0, 11.0, 175.0, 185.0)),
+        Region("polygon", "polygon", [(9, 175), (11, 175), (11, 185), (9, 185)]),
+    ],
+)
+def test_regions_across_antimeridian(region):
+    store = to_store(
+        Location(1546300800000 + i, lat, long, 5, "GPS", 1, "", None, ())
+        for i, (lat, long) in enumerate(POINTS)
+    )
+    inside = region.contains(store.latitude / E7, store.longitude / E7)
+    assert inside.tolist() == [True, True, False]
+    assert len(search_regions(store, [region])) == 2
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from gtl.spill import merge_runs, write_run
+
+RUN_LENGTHS = (7, 1, 12, 5, 9)
+
+
+@pytest.mark.parametrize("block_rows", [1, 2, 3, 5, 16])
+def test_merge_matches_stable_sort(tmp_path, block_rows):
+    """Shuffled runs sharing repeated keys merge in the order of a stable in-memory sort"""
+    rng = np.random.default_rng(block_rows)
+    total = sum(RUN_LENGTHS)
+    timestamp = rng.integers(0, 6, total).astype(np.int64)
+    record = np.arange(total, dtype=np.int64)
+    runs = []
+    start = 0
+    for number, length in enumerate(RUN_LENGTHS):
+        columns = {
+            "timestamp": timestamp[start : start + length],
+            "record": record[start : start + length],
+        }
+        runs.append(write_run(str(tmp_path), columns, "timestamp", number))
+        start += length
+    merged = merge_runs(runs, str(tmp_path), ["timestamp", "record"], "timestamp", block_rows)
+    order = np.argsort(timestamp, kind="stable")
+    assert merged["timestamp"].tolist() == timestamp[order].tolist()
+    assert merged["record"].tolist() == record[order].tolist()
@@ -0,0 +1,13 @@
+from gtl.stats import Stats
+
+
+def test_worker_stages_are_kept_apart():
+    """Worker time overlaps the stage that waited for it, so it is not added to that stage"""
+    stats = Stats()
+    with stats.stage("load"):
+        stats.merge([{"stage": "load", "seconds": 5.0}, {"stage": "parse", "seconds": 2.0}])
+    report = stats.report()
+    seconds = {entry["stage"]: entry["seconds"] for entry in report["stages"]}
+    assert seconds["worker_load"] == 5.0
+    assert seconds["worker_parse"] == 2.0
+    assert seconds["load"] <= report["seconds"] < 1.0
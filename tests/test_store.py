@@ -0,0 +1,33 @@
+import json
+import pytest
+import gtl.api
+
+RECORD = {
+    "latitudeE7": 455051234,
+    "longitudeE7": -736012345,
+    "accuracy": 15,
+    "source": "WIFI",
+    "deviceTag": 1,
+    "timestamp": "2019-01-01T00:00:00.000Z",
+}
+
+
+def write_records(tmp_path, *records):
+    path = tmp_path / "Records.json"
+    path.write_text(json.dumps({"locations": list(records)}), encoding="utf-8")
+    return path
+
+
+def test_unsigned_coordinates_and_wide_accuracy(tmp_path):
+    """Coordinates stored as unsigned 32-bit values are wrapped and accuracy is not capped"""
+    quirk = dict(RECORD, latitudeE7=4233000000, accuracy=40000)
+    quirk["timestamp"] = "2019-01-01T00:01:00.000Z"
+    locations = list(gtl.api.read(write_records(tmp_path, RECORD, quirk)))
+    assert [location.latitude for location in locations] == [45.5051234, -6.1967296]
+    assert [location.accuracy for location in locations] == [15, 40000]
+
+
+def test_out_of_range_coordinate(tmp_path):
+    bad = dict(RECORD, longitudeE7=2**33)
+    with pytest.raises(ValueError, match="2019-01-01T00:00:00.000Z"):
+        list(gtl.api.read(write_records(tmp_path, bad)))
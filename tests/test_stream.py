@@ -0,0 +1,34 @@
+import json
+import pytest
+from gtl.gtl import stream_ingest
+
+DOCUMENT = {
+    "b": 1.25,
+    "skipped": [-12.5e-3, {"c": 7}],
+    "locations": [
+        -0.000123,
+        1e-5,
+        2.5e3,
+        12345678901234567890,
+        {
+            "latitudeE7": 455051234,
+            "longitudeE7": -736012345,
+            "accuracy": 15,
+            "altitude": -1.75,
+            "timestamp": "2019-01-01T00:00:00.123Z",
+        },
+        [True, False, None, "x,]}"],
+    ],
+}
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_stream_every_chunk_size(tmp_path, chunk_size):
+    """Values cut at any chunk boundary, numbers included, decode as a whole file does"""
+    path = tmp_path / "Records.json"
+    path.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    streamed = {
+        key: list(records) for key, records in stream_ingest(path, chunk_size).items()
+    }
+    assert streamed == {"locations": DOCUMENT["locations"]}
+    assert repr(streamed["locations"]) == repr(DOCUMENT["locations"])
@@ -0,0 +1,12 @@
+from gtl.timeutil import MISSING_TIMESTAMP, format_isoformat
+
+ACTIVITY = [1546300878436, MISSING_TIMESTAMP]
+
+
+def test_activity_times_keep_the_export_form_in_utc():
+    assert format_isoformat(ACTIVITY, "UTC", zulu=True) == ["2019-01-01T00:01:18.436Z", "None"]
+    assert format_isoformat(ACTIVITY, "UTC") == ["2019-01-01T00:01:18.436+00:00", "None"]
+    assert format_isoformat(ACTIVITY, "America/Toronto", zulu=True) == [
+        "2018-12-31T19:01:18.436-05:00",
+        "None",
+    ]